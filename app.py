@@ -1,25 +1,65 @@
+import time
 import streamlit as st
-from graph import create_graph
 from langchain_core.messages import HumanMessage, AIMessage
 import db_utils
-import time
+import search_cache
+from config import embedding_provider
+from rag_setup import retriever_provider
+from job_runner import job_runner, get_job, get_events, active_jobs, QueueFullError, ACTIVE_STATES, QUEUED, DONE
 
 # Create the 'conversations' table on the first run if it doesn't exist
 db_utils.initialize_db()
 
+# Load the embedder and the retriever in the background, the page renders meanwhile.
+# A failed load is retried on a later run of the script
+retriever_provider.start()
+
+# Research runs happen in the background on the shared job runner, the page only follows their progress
+job_runner.start()
+
+# How often a followed run is checked for new progress
+JOB_POLL_SECONDS = 0.1
+
+# Status label shown when a node finishes
+NODE_LABELS = {
+    "web_search": "🔍 Searching the Web...",
+    "arxiv_search": "📄 Searching ArXiv...",
+    "rag_search": "📚 Searching Knowledge Base...",
+    "grade_and_filter": "⚖️ Grading and filtering...",
+    "refine_query": "✍️ Refining query...",
+    "refine_tools": "✍️ Refining query...",
+    "budget_context": "🧮 Preparing the context..."
+}
+
 # Streamlit Page Setup 
 st.set_page_config(page_title="Research AgentX", page_icon="🤖", layout="wide")
 st.title("Research AgentX 🤖")
 st.caption("A stateful research agent powered by LangGraph and SQLite.")
 
-# Agent and Session State Initialization
-if 'agent_app' not in st.session_state:
-    st.session_state.agent_app = create_graph()
-
 # Initialize thread_id if it's not already set
 if "thread_id" not in st.session_state:
     st.session_state.thread_id = None
 
+# Cached per version of the conversations table, which changes on create/rename/delete/touch,
+# so reruns of the script don't query the database until a conversation actually changes.
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_conversations_page(version, cursor, search):
+    return db_utils.list_conversations(cursor=cursor, search=search)
+
+def load_conversations(pages, search):
+    """Returns the conversations of the first `pages` pages and whether there are more."""
+    version = db_utils.conversations_version()
+    conversations, cursor = [], None
+    for _ in range(pages):
+        page, cursor = load_conversations_page(version, cursor, search)
+        conversations.extend(page)
+        if cursor is None:
+            break
+    return conversations, cursor is not None
+
+if "conversation_pages" not in st.session_state:
+    st.session_state.conversation_pages = 1
+
 # Sidebar for Conversation Management
 with st.sidebar:
     st.header("Conversations")
@@ -29,9 +69,11 @@ with st.sidebar:
         st.session_state.thread_id = thread_id
         st.rerun()
 
+    search = st.text_input("Search conversations", placeholder="Search by title...", label_visibility="collapsed")
+
     st.divider()
 
-    conversations = db_utils.get_all_conversations()
+    conversations, has_more = load_conversations(st.session_state.conversation_pages, search.strip() or None)
     for conv in conversations:
         cols = st.columns([0.8, 0.2])
         with cols[0]:
@@ -44,57 +86,122 @@ with st.sidebar:
         
         with cols[1]:
             if st.button("🗑️", key=f"delete_{conv['thread_id']}", help="Delete this conversation"):
-                db_utils.delete_conversation(conv['thread_id'])
-                if conv['thread_id'] == st.session_state.thread_id:
-                    st.session_state.thread_id = None
-                st.rerun()
+                try:
+                    db_utils.delete_conversation(conv['thread_id'])
+                except db_utils.ConversationBusyError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state.get("transcripts", {}).pop(conv['thread_id'], None)
+                    if conv['thread_id'] == st.session_state.thread_id:
+                        st.session_state.thread_id = None
+                    st.rerun()
+    
+    if has_more and st.button("Load more", use_container_width=True):
+        st.session_state.conversation_pages += 1
+        st.rerun()
+    
+    stats = job_runner.stats()
+    st.caption(f"Research runs: {stats['running']} running, {stats['queue_depth']} queued")
+    if retriever_provider.failed():
+        st.caption(f"⚠️ Knowledge base failed to load, retrying: {retriever_provider.error}")
+    elif not retriever_provider.is_ready():
+        st.caption("Knowledge base is warming up...")
+    if embedding_provider.is_ready() and hasattr(embedding_provider.get(), "metrics"):
+        embedding_stats = embedding_provider.get().metrics()
+        st.caption(
+            f"Embeddings: {embedding_stats['texts']} texts in {embedding_stats['batches']} batches "
+            f"(mean batch {embedding_stats['mean_batch_size']:.1f}, {embedding_stats['queue_depth']} queued)"
+        )
+    cache_stats = search_cache.get_cache_stats()
+    if cache_stats:
+        st.caption("Search cache: " + ", ".join(
+            f"{tool} {counts['hits']}/{counts['hits'] + counts['misses']} hits" for tool, counts in sorted(cache_stats.items())
+        ))
 
 # Main Chat Interface
-def display_chat_history(app, config):
+def load_transcript(config):
+    """
+    Returns the messages of the thread in `config` from the transcript log, cached in the session.
+    Conversations from before the log existed are read from their checkpoint once and backfilled.
+    """
+    thread_id = config["configurable"]["thread_id"]
+    transcripts = st.session_state.setdefault("transcripts", {})
+    if thread_id not in transcripts:
+        transcript = db_utils.get_transcript(thread_id)
+        if not transcript:
+            history = job_runner.graph.get().get_state(config)
+            messages = history.values.get('messages', []) if history else []
+            transcript = [
+                {"role": "user" if isinstance(msg, HumanMessage) else "assistant", "content": msg.content}
+                for msg in messages if isinstance(msg, (HumanMessage, AIMessage))
+            ]
+            if transcript:
+                db_utils.append_to_transcript(thread_id, transcript)
+        transcripts[thread_id] = transcript
+    return transcripts[thread_id]
+
+def display_chat_history(config):
     """Displays messages from the history for the given config."""
-    history = app.get_state(config)
-    if not history:
-        return
+    for msg in load_transcript(config):
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+def follow_job(job_id):
+    """
+    Yields the answer of a background research run as it is written. Its progress events
+    drive the status label. Any session can follow a run, e.g. after switching back to its conversation.
+    """
+    # Not used as a context manager, so that the streamed answer is written below the status box
+    job = get_job(job_id)
+    status = st.status("⏳ Queued..." if job and job["status"] == QUEUED else "Thinking...", expanded=True)
+    last_event, running, streamed = 0, job and job["status"] != QUEUED, False
+    while True:
+        # The status is read before the events, so the last events of a finished run are never missed
+        job = get_job(job_id)
+        if job and not running and job["status"] != QUEUED:
+            status.update(label="Thinking...")
+            running = True
+        
+        for event_id, kind, data in get_events(job_id, last_event):
+            last_event = event_id
+            if kind == "answer":
+                if not streamed:
+                    status.update(label="📝 Writing the answer...")
+                    streamed = True
+                yield data
+            elif data in NODE_LABELS:
+                status.update(label=NODE_LABELS[data])
+        
+        if job is None or job["status"] not in ACTIVE_STATES:
+            break
+        time.sleep(JOB_POLL_SECONDS)
     
-    messages = history.values.get('messages', [])
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            with st.chat_message("user"):
-                st.markdown(msg.content)
-        elif isinstance(msg, AIMessage):
-            with st.chat_message("assistant"):
-                st.markdown(msg.content)
-
-def stream_response(app, initial_state, config):
-    """Streams the agent's response."""
-    with st.status("Thinking...", expanded=True) as status:
-        final_answer = None
-        for step in app.stream(initial_state, config=config):
-            node = list(step.keys())[0]
-            if node == "web_search":
-                status.update(label="🔍 Searching the Web...")
-            elif node == "arxiv_search":
-                status.update(label="📄 Searching ArXiv...")
-            elif node == "rag_search":
-                status.update(label="📚 Searching Knowledge Base...")
-            elif node == "grade_and_filter":
-                status.update(label="⚖️ Grading and filtering...")
-            elif node == "refine_query":
-                status.update(label="✍️ Refining query...")
-            elif node == "synthesize":
-                output = step[node]
-                if "messages" in output and output["messages"]:
-                    final_answer = output["messages"].content
-                status.update(label="✅ Done!", state="complete")
-            time.sleep(0.5)
-        yield final_answer or "The agent finished without providing a final answer."
+    if job and job["status"] == DONE:
+        status.update(label="✅ Done!", state="complete", expanded=False)
+    else:
+        status.update(label="❌ The research run did not finish", state="error", expanded=False)
+        reason = job["error"] if job and job["error"] else "it was interrupted"
+        yield f"The research run failed: {reason}."
 
 
 # Display the history of the currently selected chat, if any.
 if st.session_state.thread_id:
-    app = st.session_state.agent_app
-    config = {"configurable": {"thread_id": st.session_state.thread_id, "recursion_limit": 50}}
-    display_chat_history(app, config)
+    config = {"configurable": {"thread_id": st.session_state.thread_id}}
+    display_chat_history(config)
+    
+    # Reattach to the runs of this conversation that are still queued or running
+    jobs = active_jobs(st.session_state.thread_id)
+    for job in jobs:
+        with st.chat_message("user"):
+            st.markdown(job["question"])
+        with st.chat_message("assistant"):
+            st.write_stream(follow_job(job["job_id"]))
+    if jobs:
+        # The finished turns are in the transcript now, reload it
+        st.session_state.get("transcripts", {}).pop(st.session_state.thread_id, None)
+        # Rerun to show them and the new sidebar order, the message of a failed run stays on screen
+        if all((get_job(job["job_id"]) or {}).get("status") == DONE for job in jobs):
+            st.rerun()
 
 # Always display the chat input box at the bottom.
 if prompt := st.chat_input("Ask a research question..."):
@@ -104,40 +211,19 @@ if prompt := st.chat_input("Ask a research question..."):
         thread_id, thread_name = db_utils.create_new_conversation()
         st.session_state.thread_id = thread_id
     
-    # Create the config for this run.
-    app = st.session_state.agent_app
-    config = {
-        "configurable": {
-            "thread_id": st.session_state.thread_id,
-            "recursion_limit": 50
-        }
-    }
+    config = {"configurable": {"thread_id": st.session_state.thread_id}}
 
     # Update the timestamp because the conversation is being used.
     db_utils.update_conversation_timestamp(st.session_state.thread_id)
-
-    # Display the user's message.
-    with st.chat_message("user"):
-        st.markdown(prompt)
     
     # Check if this is the very first message to trigger the rename.
-    history = app.get_state(config)
-    if not history.values.get("messages"):
+    if not load_transcript(config) and not active_jobs(st.session_state.thread_id):
         db_utils.rename_conversation(st.session_state.thread_id, prompt)
     
-    # Stream the assistant's response.
-    with st.chat_message("assistant"):
-        initial_state = {
-            "messages": [HumanMessage(content=prompt)],
-            "refined_query": prompt,
-            "sources": [],
-            "related_documents": [],
-            "refinements_web_used": 0,
-            "refinements_arxiv_used": 0,
-            "refinements_rag_used": 0,
-            "active_tool": "web"
-        }
-        st.write_stream(stream_response(app, initial_state, config))
-    
-    # Rerun to update the sidebar with the new name and order.
-    st.rerun()
+    # Queue the question, the rerun reattaches to it and streams the answer
+    try:
+        job_runner.submit(st.session_state.thread_id, prompt)
+    except QueueFullError as e:
+        st.error(str(e))
+    else:
+        st.rerun()
@@ -0,0 +1,146 @@
+import asyncio
+
+# Import from our local project files
+from state import ResearchState
+from config import get_llm, get_search_tool
+from grading import agrade_documents
+from search_cache import acached_search
+from llm_cache import acached_invoke, ainvoke_llm
+from history import asummary_update
+from rag_setup import retriever_provider
+import tracing
+from nodes import (
+    rag_is_ready,
+    skip_rag_update,
+    build_refine_prompt,
+    refine_cache_key,
+    refinement_update,
+    start_tool,
+    parse_web_results,
+    fetch_arxiv_results,
+    flatten_sources,
+    grading_update,
+    tools_to_refine,
+    budget_context_node,
+    build_synthesis_messages
+)
+
+# Async versions of the nodes in nodes.py. They build the same prompts and return the
+# same state updates, but await network I/O instead of blocking a thread on it.
+# The routing functions are shared with the sync graph.
+
+async def arefine_query(state: ResearchState, active_tool: str) -> str:
+    """Uses an LLM to refine the query for `active_tool` based on the conversation history."""
+    
+    tracing.count("refinements")
+    prompt = build_refine_prompt(state, active_tool)
+    new_query = await acached_invoke("refine", get_llm(), prompt, cache_key=refine_cache_key(state, active_tool))
+    
+    return new_query.content
+
+async def arefine_query_node(state: ResearchState) -> ResearchState:
+    """Refines the query based on the conversation history and the failing tool."""
+    
+    active_tool = start_tool(state)
+    refinement_key = f"refinements_{active_tool}_used"
+    history_update = await asummary_update(state)
+    
+    return {
+        **history_update,
+        'refined_query': await arefine_query({**state, **history_update}, active_tool),
+        'active_tool': active_tool,
+        refinement_key: state.get(refinement_key, 0) + 1
+    }
+
+async def arefine_tools_node(state: ResearchState) -> ResearchState:
+    """Refines the query separately for every tool of the parallel fan-out that came back empty."""
+    
+    tools = tools_to_refine(state)
+    queries = await asyncio.gather(*(arefine_query(state, tool) for tool in tools))
+    
+    return refinement_update(state, dict(zip(tools, queries)))
+
+
+async def afetch_web_results(query: str) -> list[str]:
+    """Performs a live web search and returns the content of every result."""
+    return parse_web_results(await get_search_tool().ainvoke({"query": query}))
+
+async def afetch_arxiv_results(query: str) -> list[str]:
+    """Performs a live ArXiv search. The arxiv client is blocking, so it runs in a worker thread."""
+    return await asyncio.to_thread(fetch_arxiv_results, query)
+
+async def asearch_web(query: str) -> list[str]:
+    """Performs a web search, served from the search cache when possible."""
+    return await acached_search("web", query, afetch_web_results)
+
+async def asearch_arxiv(query: str) -> list[str]:
+    """Performs an ArXiv search, served from the search cache when possible."""
+    return await acached_search("arxiv", query, afetch_arxiv_results)
+
+async def asearch_rag(query: str) -> list[str]:
+    """Performs a RAG search and returns the retrieved abstracts."""
+    
+    tracing.count("tool_calls")
+    retrieved_docs = await retriever_provider.get().ainvoke(query) or []
+    
+    return [doc.page_content for doc in retrieved_docs]
+
+ASYNC_SEARCH_FUNCTIONS = {
+    "web": asearch_web,
+    "arxiv": asearch_arxiv,
+    "rag": asearch_rag
+}
+
+
+async def aweb_search_node(state: ResearchState) -> ResearchState:
+    """Performs a web search."""
+    return {"sources": {"web": await asearch_web(state['refined_query'])}, "active_tool": "web"}
+
+async def aarxiv_search_node(state: ResearchState) -> ResearchState:
+    """Performs an ArXiv search."""
+    return {"sources": {"arxiv": await asearch_arxiv(state['refined_query'])}, "active_tool": "arxiv"}
+
+async def arag_search_node(state: ResearchState) -> ResearchState:
+    """Performs a RAG search."""
+    if not rag_is_ready():
+        return {**skip_rag_update(), "active_tool": "rag"}
+    return {"sources": {"rag": await asearch_rag(state['refined_query'])}, "active_tool": "rag"}
+
+async def aparallel_search_node(state: ResearchState) -> ResearchState:
+    """Runs one branch of the parallel fan-out, see `nodes.parallel_search_node`."""
+    
+    tool = state['active_tool']
+    query = state.get('tool_queries', {}).get(tool) or state['refined_query']
+    
+    if tool == "rag" and not rag_is_ready():
+        return skip_rag_update()
+    
+    return {"sources": {tool: await ASYNC_SEARCH_FUNCTIONS[tool](query)}}
+
+
+async def agrade_and_filter_node(state: ResearchState) -> ResearchState:
+    """Grades a list of documents and returns only the relevant ones."""
+    
+    query = state['messages'][-1].content
+    origins, documents = flatten_sources(state)
+    grades = await agrade_documents(documents, query)
+    
+    # Relevant documents are written to the document store, off the event loop
+    return await asyncio.to_thread(grading_update, state, origins, documents, grades)
+
+
+async def abudget_context_node(state: ResearchState) -> ResearchState:
+    """Fits the synthesis prompt into the context budget. Embedding is local and CPU bound, so it runs in a worker thread."""
+    return await asyncio.to_thread(budget_context_node, state)
+
+
+async def asynthesizer_node(state: ResearchState) -> ResearchState:
+    """The final node that synthesizes the answer."""
+    
+    synthesizer_messages, has_docs = await asyncio.to_thread(build_synthesis_messages, state)
+    if not has_docs:
+        return {"messages": synthesizer_messages}
+    
+    response = await ainvoke_llm(get_llm(), synthesizer_messages)
+    
+    return {"messages": response}
@@ -0,0 +1,219 @@
+"""
+Drives the compiled research graph end to end against local stand-ins for Gemini, Tavily, ArXiv
+and the RAG retriever (see benchmarks/stubs.py), on a throwaway database.
+
+Reports end-to-end latency per question, LLM calls per question, refinement loops per question,
+how much the checkpoint database grows (with the same per-turn pruning as the app) and the batch
+sizes of the embedding micro-batcher.
+Results can be saved as a baseline and later runs compared against it; a metric that gets
+worse by more than --tolerance counts as a regression and makes the command exit with status 1.
+
+--compare-policies runs the fixed and the adaptive routing policy, each in a fresh interpreter so
+that neither benefits from the other's caches, and reports the LLM calls the adaptive one saves.
+
+Usage: python -m benchmarks.end_to_end [--questions 20] [--mode sequential] [--llm-latency 50]
+       [--search-latency 100] [--failure-rate 0.0] [--relevance web=0.3,arxiv=0.5,rag=0.6]
+       [--policy fixed|adaptive] [--compare-policies] [--save-baseline baseline.json] [--baseline baseline.json]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import closing
+
+TOPICS = (
+    "transformers", "graph neural networks", "diffusion models", "contrastive learning",
+    "reinforcement learning from human feedback", "mixture of experts", "federated learning",
+    "neural architecture search", "knowledge distillation", "variational autoencoders",
+    "retrieval-augmented generation", "vision transformers", "meta-learning", "sparse attention",
+    "normalizing flows", "curriculum learning", "model quantization", "self-supervised speech models",
+    "causal inference in machine learning", "adversarial robustness"
+)
+QUESTION_TEMPLATES = (
+    "What are the main ideas behind {}?",
+    "How has research on {} evolved recently?",
+    "What are the open problems in {}?",
+    "Which papers introduced {}?"
+)
+
+# Metrics compared against the baseline, all of them are better when lower
+COMPARED_METRICS = ("p50_s", "p95_s", "llm_calls_per_question", "refinements_per_question", "db_growth_kib")
+
+def build_questions(count: int) -> list[str]:
+    # Interleaved so that every question type is represented in a short run
+    questions = [template.format(topic) for topic in TOPICS for template in QUESTION_TEMPLATES]
+    return questions[:count]
+
+def parse_relevance(text: str) -> dict[str, float]:
+    """Parses 'web=0.3,arxiv=0.5,rag=0.6' into a rate per tool."""
+    pairs = (item.split("=") for item in text.split(",") if item)
+    return {tool.strip(): float(rate) for tool, rate in pairs}
+
+def database_size(path: str) -> int:
+    """
+    Size of the database's pages, after folding the write-ahead log into the database file.
+    Measuring the files instead would count WAL frames that are superseded or not checkpointed yet.
+    """
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+def run(args) -> dict:
+    # Imported here so that DB_FILE is set before the connection manager is created
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from config import (
+        llm_provider, search_tool_provider, arxiv_client_factory_provider, embedding_provider,
+        ROUTING_POLICY, EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS
+    )
+    from embedding_service import BatchingEmbeddings
+    from rag_setup import retriever_provider
+    from sqlite_pool import DB_FILE
+    import db_utils
+    from checkpoint_maintenance import prune_thread
+    from graph import create_graph
+    from state import new_question_state
+    from benchmarks.stubs import ServiceBehaviour, FakeChatModel, FakeSearchTool, FakeArxivClient, FakeRetriever
+
+    llm = ServiceBehaviour(args.llm_latency, args.failure_rate, args.seed)
+    search = ServiceBehaviour(args.search_latency, args.failure_rate, args.seed + 1)
+    arxiv = ServiceBehaviour(args.search_latency, args.failure_rate, args.seed + 2)
+    rag = ServiceBehaviour(args.rag_latency, 0.0, args.seed + 3)
+
+    llm_provider.override(FakeChatModel(behaviour=llm, relevance=parse_relevance(args.relevance), seed=args.seed))
+    search_tool_provider.override(FakeSearchTool(search))
+    arxiv_client_factory_provider.override(lambda: FakeArxivClient(arxiv))
+    retriever_provider.override(FakeRetriever(behaviour=rag))
+    # Embeddings go through the same micro-batching service as in the app
+    embeddings = BatchingEmbeddings(DeterministicFakeEmbedding(size=64), EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS)
+    embedding_provider.override(embeddings)
+
+    db_utils.initialize_db()
+    app = create_graph(args.mode)
+    size_before = database_size(DB_FILE)
+
+    latencies, llm_calls, refinements, failures = [], [], [], 0
+    for question in build_questions(args.questions):
+        thread_id = str(uuid.uuid4())
+        config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 50}
+        calls_before = llm.calls
+        started = time.perf_counter()
+        try:
+            final_state = app.invoke(new_question_state(question), config=config)
+        except Exception as e:
+            failures += 1
+            print(f"Run failed for {question!r}: {e}", file=sys.stderr)
+            continue
+        latencies.append(time.perf_counter() - started)
+        llm_calls.append(llm.calls - calls_before)
+        refinements.append(sum(final_state.get(f"refinements_{tool}_used", 0) for tool in ("web", "arxiv", "rag")))
+        prune_thread(thread_id)
+
+    completed = max(1, len(latencies))
+    embedding_metrics = embeddings.metrics()
+    return {
+        "mode": args.mode,
+        "policy": ROUTING_POLICY,
+        "questions": args.questions,
+        "failed_runs": failures,
+        "p50_s": statistics.median(latencies) if latencies else 0.0,
+        "p95_s": sorted(latencies)[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        "llm_calls_per_question": sum(llm_calls) / completed,
+        "refinements_per_question": sum(refinements) / completed,
+        "search_calls": search.calls + arxiv.calls + rag.calls,
+        "db_growth_kib": (database_size(DB_FILE) - size_before) / 1024,
+        "embedding_batches": embedding_metrics["batches"],
+        "embedding_mean_batch_size": embedding_metrics["mean_batch_size"],
+        "embedding_max_batch_size": embedding_metrics["max_batch_size"]
+    }
+
+def run_policy(args, policy: str) -> dict:
+    """Runs the benchmark with `policy` in a fresh interpreter and returns its results."""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "results.json")
+        command = [
+            sys.executable, "-m", "benchmarks.end_to_end", "--policy", policy, "--save-baseline", output,
+            "--questions", str(args.questions), "--mode", args.mode, "--llm-latency", str(args.llm_latency),
+            "--search-latency", str(args.search_latency), "--rag-latency", str(args.rag_latency),
+            "--failure-rate", str(args.failure_rate), "--relevance", args.relevance, "--seed", str(args.seed)
+        ]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+def compare_policies(args):
+    fixed, adaptive = run_policy(args, "fixed"), run_policy(args, "adaptive")
+    print(f"{'metric':<26}{'fixed':>12}{'adaptive':>12}")
+    for metric in COMPARED_METRICS + ("search_calls",):
+        print(f"{metric:<26}{fixed[metric]:>12.3f}{adaptive[metric]:>12.3f}")
+    
+    saved = fixed["llm_calls_per_question"] - adaptive["llm_calls_per_question"]
+    share = saved / fixed["llm_calls_per_question"] if fixed["llm_calls_per_question"] else 0.0
+    print(f"\nAverage LLM calls saved per question: {saved:.2f} ({share:.1%})")
+
+def compare(results: dict, baseline: dict, tolerance: float) -> tuple[list[str], bool]:
+    """Returns a line per compared metric, and whether any of them regressed beyond `tolerance`."""
+    lines, regressed = [], False
+    for metric in COMPARED_METRICS:
+        old, new = baseline.get(metric), results[metric]
+        if old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = change > tolerance
+        regressed |= worse
+        lines.append(f"{metric:<26}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{'  REGRESSION' if worse else ''}")
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the research graph.")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--mode", default="sequential", choices=["sequential", "parallel"])
+    parser.add_argument("--llm-latency", type=float, default=50, help="Milliseconds per LLM call.")
+    parser.add_argument("--search-latency", type=float, default=100, help="Milliseconds per web/ArXiv search.")
+    parser.add_argument("--rag-latency", type=float, default=10, help="Milliseconds per RAG search.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of LLM and search calls that fail.")
+    parser.add_argument("--relevance", default="web=0.3,arxiv=0.5,rag=0.6", help="Share of relevant documents per tool.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", choices=["fixed", "adaptive"], help="Routing policy, ROUTING_POLICY by default.")
+    parser.add_argument("--compare-policies", action="store_true", help="Run both routing policies and report the LLM calls saved.")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare the results with this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative worsening reported as a regression.")
+    args = parser.parse_args()
+
+    if args.compare_policies:
+        compare_policies(args)
+        return
+    if args.policy:
+        os.environ["ROUTING_POLICY"] = args.policy
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DB_FILE"] = os.path.join(directory, "benchmark.sqlite")
+        results = run(args)
+
+    for key, value in results.items():
+        print(f"{key:<26}{value:.3f}" if isinstance(value, float) else f"{key:<26}{value}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n{'metric':<26}{'baseline':>12}{'current':>12}{'change':>10}")
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print("\n".join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compares dense, hybrid and hybrid + reranker retrieval by the relevance of what they return.
+
+Every returned abstract costs a grader LLM call in the graph, and a RAG round without any relevant
+abstract makes the graph refine the query. For every retriever this reports, per query: abstracts
+returned (grader calls), relevant abstracts, precision, refinements (the share of queries whose
+first round returns nothing relevant) and the mean latency.
+
+All retrievers return RETRIEVER_K abstracts out of the same HYBRID_CANDIDATES dense candidates, so
+they differ only in how the candidates are ranked. The configuration the app runs with is marked.
+
+Queries come from a JSON file written independently of the index (benchmarks/hybrid_queries.json
+by default). An entry is either {"query": ..., "relevant_titles": [...]}, judged against the
+labelled titles, or a plain string, judged by the app's own LLM grader (this needs GOOGLE_API_KEY).
+Labelled queries none of whose papers are in the store are left out and reported.
+
+Usage: python -m benchmarks.hybrid_retrieval [--queries-file queries.json] [--reranker MODEL]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from langchain_core.runnables import RunnableLambda
+
+# Import from our local project files
+from config import (
+    RETRIEVER_BACKEND, RETRIEVER_K, RETRIEVER_HYBRID, RETRIEVER_RERANKER, HYBRID_CANDIDATES, get_embedding_function
+)
+from rag_setup import RETRIEVER_BACKENDS, get_chroma_store, iter_collection
+from hybrid_retrieval import create_hybrid_retriever
+from grading import grade_documents
+
+DEFAULT_QUERIES_FILE = os.path.join(os.path.dirname(__file__), "hybrid_queries.json")
+
+def normalize_title(title: str) -> str:
+    # arXiv titles come with line breaks and double spaces
+    return " ".join(title.lower().split())
+
+def load_queries(path: str) -> list[tuple[str, set[str] | None]]:
+    """Returns (query, labelled relevant titles or None for LLM grading) pairs."""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [
+        (entry, None) if isinstance(entry, str) else (entry["query"], {normalize_title(t) for t in entry["relevant_titles"]})
+        for entry in entries
+    ]
+
+def stored_titles(collection) -> set[str]:
+    return {
+        normalize_title((meta or {}).get("title", ""))
+        for batch in iter_collection(collection, ["metadatas"]) for meta in batch["metadatas"]
+    }
+
+def relevance(docs, query: str, labels: set[str] | None) -> list[bool]:
+    if labels is not None:
+        return [normalize_title(doc.metadata.get("title", "")) in labels for doc in docs]
+    return [grade.related for grade in grade_documents([doc.page_content for doc in docs], query)]
+
+def evaluate(retriever, queries: list[tuple[str, set[str] | None]]) -> dict:
+    returned, relevant, misses, timings = [], [], 0, []
+    for query, labels in queries:
+        started = time.perf_counter()
+        docs = retriever.invoke(query)
+        timings.append(time.perf_counter() - started)
+        hits = sum(relevance(docs, query, labels))
+        returned.append(len(docs))
+        relevant.append(hits)
+        # The graph refines the query after a RAG round that added no relevant document
+        misses += hits == 0
+    return {
+        "returned": statistics.mean(returned),
+        "relevant": statistics.mean(relevant),
+        "precision": sum(relevant) / sum(returned) if sum(returned) else 0.0,
+        "refinements": misses / len(queries),
+        "mean_ms": statistics.mean(timings) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense vs hybrid retrieval by graded or labelled relevance.")
+    parser.add_argument("--queries-file", default=DEFAULT_QUERIES_FILE, help="JSON list of queries, plain or with 'relevant_titles' labels.")
+    parser.add_argument("--reranker", default=RETRIEVER_RERANKER or "cross-encoder/ms-marco-MiniLM-L-6-v2", help="Cross-encoder for the reranked variant, empty to skip it.")
+    args = parser.parse_args()
+
+    embedding_function = get_embedding_function()
+    collection = get_chroma_store(embedding_function)._collection
+
+    queries = load_queries(args.queries_file)
+    titles = stored_titles(collection)
+    answerable = [(query, labels) for query, labels in queries if labels is None or labels & titles]
+    print(f"{len(answerable)} of {len(queries)} queries have a relevant paper in the store, k={RETRIEVER_K}, {HYBRID_CANDIDATES} candidates")
+    if not answerable:
+        return
+
+    # One candidate list for every variant: the dense baseline keeps its top RETRIEVER_K
+    candidates = RETRIEVER_BACKENDS[RETRIEVER_BACKEND](embedding_function, k=HYBRID_CANDIDATES)
+    retrievers = {
+        f"dense ({RETRIEVER_BACKEND})": (candidates | RunnableLambda(lambda docs: docs[:RETRIEVER_K]), not RETRIEVER_HYBRID),
+        "hybrid": (create_hybrid_retriever(candidates, collection), RETRIEVER_HYBRID and not RETRIEVER_RERANKER)
+    }
+    if args.reranker:
+        shipped = RETRIEVER_HYBRID and RETRIEVER_RERANKER == args.reranker
+        retrievers["hybrid + rerank"] = (create_hybrid_retriever(candidates, collection, args.reranker), shipped)
+
+    print(f"{'retriever':>20} {'returned/q':>11} {'relevant/q':>11} {'precision':>10} {'refines/q':>10} {'mean ms':>8}")
+    for name, (retriever, shipped) in retrievers.items():
+        r = evaluate(retriever, answerable)
+        label = f"{name}{' *' if shipped else ''}"
+        print(
+            f"{label:>20} {r['returned']:>11.2f} {r['relevant']:>11.2f} {r['precision']:>10.3f} "
+            f"{r['refinements']:>10.3f} {r['mean_ms']:>8.1f}"
+        )
+    print("* the configuration the app runs with")
+
+
+if __name__ == "__main__":
+    main()
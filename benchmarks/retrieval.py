@@ -0,0 +1,88 @@
+"""
+Compares the ANN index against exact search on the arXiv corpus: recall@k and p50/p95/p99 latency
+for a sweep of nprobe (IVF) or efSearch (HNSW) values. Queries are paper titles from the corpus.
+
+The index is built from the Chroma store if needed (see vector_index.build_ann_index).
+Usage: python -m benchmarks.retrieval [--queries 500] [--k 3] [--values 1 4 16 64]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+import numpy as np
+import faiss
+
+# Import from our local project files
+from config import ANN_INDEX_TYPE, get_embedding_function
+from rag_setup import get_chroma_store
+from vector_index import (
+    DOCSTORE_FILE,
+    INDEX_FILE,
+    build_ann_index,
+    iter_store_batches,
+    load_ann_index,
+    normalize_rows,
+    set_search_params
+)
+
+def percentile_ms(timings: list[float], q: float) -> float:
+    return float(np.percentile(timings, q)) * 1000
+
+def timed_search(index, queries: np.ndarray, k: int) -> tuple[np.ndarray, list[float]]:
+    """Searches one query at a time, like the RAG node does, and returns the results and per-query latencies."""
+    results, timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, positions = index.search(query.reshape(1, -1), k)
+        timings.append(time.perf_counter() - started)
+        results.append(positions[0])
+    return np.stack(results), timings
+
+def recall_at_k(approximate: np.ndarray, exact: np.ndarray) -> float:
+    """Average share of the exact top-k found by the approximate search."""
+    return float(np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact)]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ANN retriever against exact search.")
+    parser.add_argument("--queries", type=int, default=500, help="Number of sampled title queries.")
+    parser.add_argument("--k", type=int, default=3, help="Neighbours per query.")
+    parser.add_argument("--values", type=int, nargs="+", default=[1, 4, 16, 64, 128], help="nprobe/efSearch values to sweep.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    embedding_function = get_embedding_function()
+    collection = get_chroma_store(embedding_function)._collection
+    if not os.path.exists(INDEX_FILE):
+        build_ann_index(collection)
+    
+    # Exact baseline: a flat inner-product index over the same vectors, in the same order as the ANN index
+    exact_index = None
+    for vectors, _, _ in iter_store_batches(collection):
+        vectors = normalize_rows(vectors)
+        if exact_index is None:
+            exact_index = faiss.IndexFlatIP(vectors.shape[1])
+        exact_index.add(vectors)
+    
+    with sqlite3.connect(DOCSTORE_FILE) as docstore:
+        titles = [row[0] for row in docstore.execute("SELECT title FROM documents WHERE title IS NOT NULL")]
+    random.Random(args.seed).shuffle(titles)
+    queries = normalize_rows(np.asarray(embedding_function.embed_documents(titles[:args.queries])))
+    
+    exact, exact_timings = timed_search(exact_index, queries, args.k)
+    print(f"{len(queries)} queries, k={args.k}, {exact_index.ntotal} vectors, index type '{ANN_INDEX_TYPE}'")
+    print(f"{'search':>14} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print(f"{'exact':>14} {1.0:>9.3f} {percentile_ms(exact_timings, 50):>8.2f} "
+          f"{percentile_ms(exact_timings, 95):>8.2f} {percentile_ms(exact_timings, 99):>8.2f}")
+    
+    index = load_ann_index()
+    knob = "efSearch" if hasattr(index, "hnsw") else "nprobe"
+    for value in args.values:
+        set_search_params(index, nprobe=value, ef_search=value)
+        approximate, timings = timed_search(index, queries, args.k)
+        print(f"{f'{knob}={value}':>14} {recall_at_k(approximate, exact):>9.3f} {percentile_ms(timings, 50):>8.2f} "
+              f"{percentile_ms(timings, 95):>8.2f} {percentile_ms(timings, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
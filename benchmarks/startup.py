@@ -0,0 +1,64 @@
+"""
+Measures the time until app.py can render its first page, in a fresh interpreter each run.
+
+"lazy" is the current startup path: import the graph, initialize the database, compile the graph
+and start the retriever warm-up in the background. "eager" additionally blocks on building the LLM,
+the search tool, the embedder and the retriever, which is what importing config and nodes used to do.
+
+Usage: python -m benchmarks.startup [--runs 3]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+LAZY_STARTUP = """
+import time
+started = time.perf_counter()
+import db_utils
+from graph import create_graph
+from rag_setup import retriever_provider
+db_utils.initialize_db()
+create_graph()
+retriever_provider.start()
+print(time.perf_counter() - started)
+"""
+
+EAGER_STARTUP = """
+import time
+started = time.perf_counter()
+import db_utils
+from graph import create_graph
+from config import get_llm, get_search_tool, get_embedding_function
+from rag_setup import retriever_provider
+get_llm()
+get_search_tool()
+get_embedding_function()
+retriever_provider.get()
+db_utils.initialize_db()
+create_graph()
+print(time.perf_counter() - started)
+"""
+
+def time_startup(script: str) -> float:
+    """Runs a startup script in a fresh interpreter and returns its time to first render, in seconds."""
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the time to first render of app.py.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per variant.")
+    args = parser.parse_args()
+    
+    # Run eager first, so the retriever store exists and both variants measure a warm start
+    results = {}
+    for name, script in (("eager", EAGER_STARTUP), ("lazy", LAZY_STARTUP)):
+        results[name] = [time_startup(script) for _ in range(args.runs)]
+    
+    for name, timings in results.items():
+        print(f"{name:>5}: median {statistics.median(timings):.2f}s  (min {min(timings):.2f}s, max {max(timings):.2f}s)")
+    print(f"speedup: {statistics.median(results['eager']) / statistics.median(results['lazy']):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Deterministic local stand-ins for Gemini, Tavily, the ArXiv client and the RAG retriever.
+
+Every stand-in sleeps for a configurable latency and fails with a configurable rate. Whether a
+document is relevant is a stable function of its text, so a given seed and relevance pattern
+always produce the same grades, refinements and answers.
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+
+# Import from our local project files
+from state import SourceGrade
+
+DOCUMENT_PATTERN = re.compile(r"Document:\n\n(.*)\n\nQuestion:", re.DOTALL)
+TOOL_TAG_PATTERN = re.compile(r"^\[(\w+)\]")
+
+def stable_fraction(text: str, seed: int) -> float:
+    """Maps `text` to a number in [0, 1) that only depends on the text and the seed."""
+    digest = hashlib.sha256(f"{seed}:{text}".encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 2**32
+
+def short_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+
+
+class ServiceBehaviour:
+    """Latency, failure rate and call counter shared by one stand-in service."""
+
+    def __init__(self, latency_ms: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, name: str):
+        """Counts a call, waits for the latency and raises for the configured share of calls."""
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise RuntimeError(f"Simulated {name} failure")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering every prompt with a deterministic text. Its structured output grades a
+    document as relevant with the probability configured for the tool that returned it.
+    """
+
+    behaviour: Any
+    relevance: dict[str, float]
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-research-model"
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.behaviour.call("LLM")
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = f"synthetic response {short_hash(prompt)}"
+        input_tokens = count_tokens_approximately(messages)
+        output_tokens = count_tokens_approximately([AIMessage(content=content)])
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def is_relevant(self, document: str) -> bool:
+        tag = TOOL_TAG_PATTERN.match(document)
+        rate = self.relevance.get(tag.group(1), 0.0) if tag else 0.0
+        return stable_fraction(document, self.seed) < rate
+
+    def grade(self, prompt: str) -> SourceGrade:
+        self.behaviour.call("grader")
+        match = DOCUMENT_PATTERN.search(prompt)
+        return SourceGrade(related=bool(match) and self.is_relevant(match.group(1)))
+
+    def with_structured_output(self, schema, **kwargs):
+        return RunnableLambda(self.grade)
+
+
+class FakeSearchTool:
+    """Stands in for TavilySearchResults: `results_per_query` results tagged with '[web]'."""
+
+    def __init__(self, behaviour: ServiceBehaviour, results_per_query: int = 3):
+        self.behaviour = behaviour
+        self.results_per_query = results_per_query
+
+    def invoke(self, tool_input: dict) -> list[dict]:
+        self.behaviour.call("web search")
+        query = tool_input["query"]
+        return [
+            {"url": f"https://example.com/{short_hash(query)}/{i}", "content": f"[web] {query} result {i}"}
+            for i in range(self.results_per_query)
+        ]
+
+    async def ainvoke(self, tool_input: dict) -> list[dict]:
+        return self.invoke(tool_input)
+
+
+class FakeArxivClient:
+    """Stands in for arxiv.Client: yields `search.max_results` papers tagged with '[arxiv]'."""
+
+    def __init__(self, behaviour: ServiceBehaviour):
+        self.behaviour = behaviour
+
+    def results(self, search):
+        self.behaviour.call("ArXiv search")
+        for i in range(search.max_results or 3):
+            yield SimpleNamespace(
+                title=f"Paper {i} on {search.query}",
+                summary=f"[arxiv] {search.query} abstract {i}"
+            )
+
+
+class FakeRetriever(BaseRetriever):
+    """Stands in for the RAG retriever: `k` abstracts tagged with '[rag]'."""
+
+    behaviour: Any
+    k: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        self.behaviour.call("retriever")
+        return [Document(page_content=f"[rag] {query} abstract {i}") for i in range(self.k)]
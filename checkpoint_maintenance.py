@@ -0,0 +1,128 @@
+import argparse
+import logging
+import os
+import sqlite3
+
+# Import from our local project files
+from config import CHECKPOINT_RETENTION
+from db_utils import get_db_connection, DB_FILE
+
+logger = logging.getLogger(__name__)
+
+# Tables written by LangGraph's SqliteSaver and the size of each row
+CHECKPOINT_TABLES = {
+    "checkpoints": "length(checkpoint) + length(metadata)",
+    "writes": "length(value)"
+}
+
+def thread_storage_bytes(conn: sqlite3.Connection, thread_id: str) -> int:
+    """Returns the bytes of checkpoint data stored for a thread."""
+    total = 0
+    for table, size in CHECKPOINT_TABLES.items():
+        row = conn.execute(f"SELECT COALESCE(SUM({size}), 0) FROM {table} WHERE thread_id = ?", (thread_id,)).fetchone()
+        total += row[0]
+    return total
+
+def prune_thread(thread_id: str, keep_last: int = CHECKPOINT_RETENTION) -> int:
+    """
+    Deletes all but the last `keep_last` checkpoints of a thread (per checkpoint namespace),
+    with their pending writes. Returns the bytes saved.
+    """
+    keep_last = max(1, keep_last)
+    with get_db_connection() as conn:
+        try:
+            before = thread_storage_bytes(conn, thread_id)
+        except sqlite3.OperationalError:
+            # The checkpointer didn't create its tables yet, nothing to prune
+            return 0
+        
+        # Checkpoint ids are time-ordered, so the last ones sort highest
+        stale = conn.execute(
+            """
+            SELECT checkpoint_ns, checkpoint_id FROM (
+                SELECT checkpoint_ns, checkpoint_id,
+                       ROW_NUMBER() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS position
+                FROM checkpoints WHERE thread_id = ?
+            ) WHERE position > ?
+            """,
+            (thread_id, keep_last)
+        ).fetchall()
+        for table in CHECKPOINT_TABLES:
+            conn.executemany(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                [(thread_id, ns, checkpoint_id) for ns, checkpoint_id in stale]
+            )
+        
+        return before - thread_storage_bytes(conn, thread_id)
+
+def prune_all_threads(keep_last: int = CHECKPOINT_RETENTION) -> dict[str, int]:
+    """Applies the retention policy to every thread. Returns the bytes saved per thread."""
+    with get_db_connection() as conn:
+        try:
+            thread_ids = [row[0] for row in conn.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+        except sqlite3.OperationalError:
+            return {}
+    return {thread_id: prune_thread(thread_id, keep_last) for thread_id in thread_ids}
+
+def referenced_document_hashes() -> set[str]:
+    """Collects the document hashes referenced by the remaining checkpoints."""
+    # Imported here, it is only needed by the compaction command
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    
+    saver = SqliteSaver(get_db_connection())
+    hashes = set()
+    for checkpoint in saver.list(None):
+        hashes.update(checkpoint.checkpoint["channel_values"].get("related_documents", []))
+    return hashes
+
+def delete_unreferenced_documents() -> int:
+    """Deletes stored documents that no checkpoint references anymore. Returns how many were deleted."""
+    referenced = referenced_document_hashes()
+    with get_db_connection() as conn:
+        stored = [row[0] for row in conn.execute("SELECT hash FROM documents")]
+        unreferenced = [(h,) for h in stored if h not in referenced]
+        conn.executemany("DELETE FROM documents WHERE hash = ?", unreferenced)
+    return len(unreferenced)
+
+def compact(keep_last: int = CHECKPOINT_RETENTION) -> dict:
+    """
+    Prunes every thread, drops unreferenced documents and rewrites the database file.
+    Returns the bytes saved per thread and the file size before and after.
+    """
+    size_before = os.path.getsize(DB_FILE)
+    saved = prune_all_threads(keep_last)
+    deleted_documents = delete_unreferenced_documents()
+    
+    conn = get_db_connection()
+    conn.commit()
+    # Fold the WAL back into the main file, then rebuild the file without the free pages
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    
+    return {
+        "saved_per_thread": saved,
+        "deleted_documents": deleted_documents,
+        "size_before": size_before,
+        "size_after": os.path.getsize(DB_FILE)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpoint retention and database maintenance.")
+    parser.add_argument("command", choices=["prune", "compact"], help="'prune' applies the retention policy, 'compact' also drops unreferenced documents and VACUUMs.")
+    parser.add_argument("--keep", type=int, default=CHECKPOINT_RETENTION, help="Checkpoints kept per thread.")
+    parser.add_argument("--thread", help="Only prune this thread.")
+    args = parser.parse_args()
+    
+    if args.command == "prune":
+        saved = {args.thread: prune_thread(args.thread, args.keep)} if args.thread else prune_all_threads(args.keep)
+    else:
+        report = compact(args.keep)
+        saved = report["saved_per_thread"]
+    
+    for thread_id, saved_bytes in sorted(saved.items(), key=lambda item: -item[1]):
+        print(f"{thread_id}: {saved_bytes / 1024:.1f} KiB saved")
+    print(f"Total: {sum(saved.values()) / 1024:.1f} KiB saved over {len(saved)} threads")
+    if args.command == "compact":
+        print(f"Deleted {report['deleted_documents']} unreferenced documents")
+        print(f"{DB_FILE}: {report['size_before'] / 1024:.1f} KiB -> {report['size_after'] / 1024:.1f} KiB")
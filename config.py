@@ -1,14 +1,225 @@
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
+import logging
+import os
+import threading
+import time
 from dotenv import load_dotenv
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize models and tools once and import them elsewhere
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.5)
-search_tool = TavilySearchResults(max_results=3)
-embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Micro-batching of embedding requests: texts per forward pass, and how long a request
+# waits for others to join its batch
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", 64))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", 5))
+
+
+class LazyProvider:
+    """
+    Builds an object on first use and hands out the same instance afterwards.
+    Thread-safe: concurrent first calls wait for a single build.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def is_ready(self) -> bool:
+        return self._instance is not None
+
+    def override(self, instance):
+        """Replaces the object with `instance`, e.g. a local stand-in for benchmarks."""
+        with self._lock:
+            self._instance = instance
+
+
+class BackgroundProvider(LazyProvider):
+    """
+    A LazyProvider that can also be built ahead of time on a background thread.
+    A failed warm-up is logged and kept in `error`, the next `start()` after
+    `retry_seconds` tries again.
+    """
+
+    def __init__(self, factory, retry_seconds: float = 30):
+        super().__init__(factory)
+        self.retry_seconds = retry_seconds
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._failed_at = None
+        self.error = None
+
+    def start(self):
+        """Starts building the object in the background, once, or again once a failed build may be retried."""
+        with self._start_lock:
+            retry = self._failed_at is not None and time.monotonic() - self._failed_at >= self.retry_seconds
+            if self._thread is None or retry:
+                self._failed_at = None
+                self._thread = threading.Thread(target=self._warm_up, name="provider-warm-up", daemon=True)
+                self._thread.start()
+
+    def _warm_up(self):
+        try:
+            self.get()
+            self.error = None
+        except Exception as e:
+            logger.exception("Warm-up failed, retrying in %.0f s", self.retry_seconds)
+            self.error = e
+            self._failed_at = time.monotonic()
+
+    def failed(self) -> bool:
+        """Whether the last warm-up failed and nothing was built."""
+        return self._instance is None and self.error is not None
+
+    def get_if_ready(self):
+        """Returns the object if it is built, otherwise starts (or retries) the warm-up and returns None."""
+        if self._instance is None:
+            self.start()
+        return self._instance
+
+
+# The models and tools are created on first use, so importing this module stays cheap.
+# Their libraries are imported inside the factories for the same reason.
+def _create_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.5)
+
+def _create_search_tool():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    return TavilySearchResults(max_results=3)
+
+def _create_arxiv_client():
+    import arxiv
+    return arxiv.Client()
+
+def _create_arxiv_client_factory():
+    # A new client per search, as before the providers existed: arxiv.Client keeps its 3 s request
+    # delay and rate-limit state per instance, without a lock, so a shared client would run the
+    # concurrent searches of all sessions and parallel branches one at a time
+    return _create_arxiv_client
+
+def _create_embedding_function():
+    # Every query embedding (retrieval, deduplication, semantic cache) goes through one micro-batching service
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from embedding_service import BatchingEmbeddings
+    return BatchingEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+        max_batch_size=EMBED_MAX_BATCH_SIZE,
+        max_wait_ms=EMBED_MAX_WAIT_MS
+    )
+
+llm_provider = LazyProvider(_create_llm)
+search_tool_provider = LazyProvider(_create_search_tool)
+arxiv_client_factory_provider = LazyProvider(_create_arxiv_client_factory)
+embedding_provider = LazyProvider(_create_embedding_function)
+
+def get_llm():
+    return llm_provider.get()
+
+def get_search_tool():
+    return search_tool_provider.get()
+
+def get_arxiv_client():
+    """Returns a new ArXiv client, see _create_arxiv_client_factory."""
+    return arxiv_client_factory_provider.get()()
+
+def get_embedding_function():
+    return embedding_provider.get()
+
+# Grading settings: how many documents are graded at once, and how long a single grade may take
+GRADER_MAX_CONCURRENCY = int(os.getenv("GRADER_MAX_CONCURRENCY", 8))
+GRADER_TIMEOUT_SECONDS = float(os.getenv("GRADER_TIMEOUT_SECONDS", 20))
+
+# Graph topology: "sequential" runs web -> arxiv -> rag one after another,
+# "parallel" fans out to all three tools in a single step
+GRAPH_MODE = os.getenv("GRAPH_MODE", "sequential")
+
+# Number of arXiv abstracts loaded into the RAG store, raising it only embeds the new rows
+RAG_CORPUS_SIZE = int(os.getenv("RAG_CORPUS_SIZE", 80000))
+
+# Search result cache: how long results stay fresh per tool (seconds) and how many are kept
+SEARCH_CACHE_TTL_SECONDS = {
+    "web": int(os.getenv("WEB_SEARCH_CACHE_TTL", 6 * 60 * 60)),
+    "arxiv": int(os.getenv("ARXIV_SEARCH_CACHE_TTL", 7 * 24 * 60 * 60))
+}
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 5000))
+
+# LLM response cache: call sites with the exact-match tier ("refine", "grade", "title"),
+# call sites that also use the semantic tier, its similarity threshold and the size of each tier
+LLM_CACHE_SITES = set(filter(None, os.getenv("LLM_CACHE_SITES", "refine,grade,title").split(",")))
+LLM_SEMANTIC_CACHE_SITES = set(filter(None, os.getenv("LLM_SEMANTIC_CACHE_SITES", "title").split(",")))
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", 0.95))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2000))
+
+# Context budget before synthesis: token budget of the whole prompt, share reserved for
+# the conversation history and the similarity above which two documents count as duplicates
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 12000))
+CONTEXT_HISTORY_SHARE = float(os.getenv("CONTEXT_HISTORY_SHARE", 0.3))
+DEDUP_SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", 0.95))
+
+# Conversation history in refinement prompts: turns kept verbatim (older ones are summarized)
+# and the maximum length of each verbatim message
+HISTORY_VERBATIM_TURNS = int(os.getenv("HISTORY_VERBATIM_TURNS", 3))
+HISTORY_MAX_MESSAGE_CHARS = int(os.getenv("HISTORY_MAX_MESSAGE_CHARS", 2000))
+
+# Checkpoints kept per conversation thread, older ones are pruned after every turn
+CHECKPOINT_RETENTION = int(os.getenv("CHECKPOINT_RETENTION", 10))
+
+# Retriever backend: "chroma" (exact search in the Chroma store) or "faiss" (approximate
+# nearest-neighbour index, memory-mapped from disk), and the search parameters of both
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "chroma")
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", 3))
+RETRIEVER_SCORE_THRESHOLD = float(os.getenv("RETRIEVER_SCORE_THRESHOLD", 0.5))
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "ivf")    # "ivf" (nprobe) or "hnsw" (efSearch)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", 16))
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", 64))
+
+# Hybrid retrieval: fuse a BM25 keyword index with the dense backend, optionally reranking the fused
+# candidates with a local cross-encoder (empty RETRIEVER_RERANKER disables it). Off until it shows a
+# measured gain on graded relevance (see benchmarks/hybrid_retrieval.py). Keyword hits must score at
+# least SPARSE_MIN_BM25 (FTS5's bm25() negated, higher is better) to be returned
+RETRIEVER_HYBRID = os.getenv("RETRIEVER_HYBRID", "false").lower() == "true"
+SPARSE_MIN_BM25 = float(os.getenv("SPARSE_MIN_BM25", 5.0))
+RETRIEVER_RERANKER = os.getenv("RETRIEVER_RERANKER", "")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 10))
+
+# Routing between the search tools: "fixed" (web -> arxiv -> rag) or "adaptive" (stop once enough
+# relevant documents are found, order and skip tools by query type and their measured precision).
+# "Enough" defaults to what one search returns. A tool's precision is smoothed towards
+# ROUTING_PRIOR_PRECISION as if ROUTING_PRIOR_DOCUMENTS had been graded at that rate, and a tool
+# is only skipped for low precision once it has ROUTING_MIN_SAMPLES graded searches
+ROUTING_POLICY = os.getenv("ROUTING_POLICY", "fixed")
+ROUTING_ENOUGH_DOCUMENTS = int(os.getenv("ROUTING_ENOUGH_DOCUMENTS", RETRIEVER_K))
+ROUTING_MIN_PRECISION = float(os.getenv("ROUTING_MIN_PRECISION", 0.15))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", 5))
+ROUTING_PRIOR_PRECISION = float(os.getenv("ROUTING_PRIOR_PRECISION", 0.5))
+ROUTING_PRIOR_DOCUMENTS = int(os.getenv("ROUTING_PRIOR_DOCUMENTS", 6))
+
+# Conversation titles are generated in the background, several new conversations per LLM call:
+# the batch size, and how long a title request waits for others to join its batch
+TITLE_BATCH_SIZE = int(os.getenv("TITLE_BATCH_SIZE", 8))
+TITLE_BATCH_WAIT_SECONDS = float(os.getenv("TITLE_BATCH_WAIT_SECONDS", 2))
+
+# Background research runs: worker threads shared by every session, and how many questions may be
+# queued or running at once before new ones are turned away
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 32))
+
+# Per-node tracing (wall time, tokens, tool calls, cache hits) into the node_traces table, and the
+# model price used for the cost column in dollars per million tokens
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_COST_PER_MILLION_TOKENS = {
+    "input": float(os.getenv("TRACE_COST_INPUT", 0.10)),
+    "output": float(os.getenv("TRACE_COST_OUTPUT", 0.40))
+}
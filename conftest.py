@@ -0,0 +1 @@
+# Makes pytest put the project root on sys.path, so tests import the top-level modules directly
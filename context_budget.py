@@ -0,0 +1,57 @@
+import numpy as np
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+
+# Import from our local project files
+from config import get_embedding_function, DEDUP_SIMILARITY_THRESHOLD
+
+def count_text_tokens(texts: list[str]) -> int:
+    """Approximates the number of tokens of a list of texts, the same way messages are counted."""
+    return count_tokens_approximately([HumanMessage(content=text) for text in texts])
+
+def dedupe_and_rank(documents: list[str], question: str, threshold: float = DEDUP_SIMILARITY_THRESHOLD) -> list[str]:
+    """
+    Orders documents by similarity to the question, most similar first,
+    and drops every document nearly identical to a better ranked one.
+    """
+    if not documents:
+        return []
+    
+    embedding_function = get_embedding_function()
+    vectors = np.asarray(embedding_function.embed_documents(documents), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(embedding_function.embed_query(question), dtype=np.float32)
+    query /= max(np.linalg.norm(query), 1e-12)
+    
+    kept = []
+    for index in np.argsort(-(vectors @ query)):
+        if all(float(vectors[index] @ vectors[other]) < threshold for other in kept):
+            kept.append(int(index))
+    
+    return [documents[index] for index in kept]
+
+def fit_documents(documents: list[str], max_tokens: int) -> list[str]:
+    """Keeps the leading documents that fit in `max_tokens`, always keeping at least the first one."""
+    kept, used = [], 0
+    for doc in documents:
+        tokens = count_text_tokens([doc])
+        if kept and used + tokens > max_tokens:
+            break
+        kept.append(doc)
+        used += tokens
+    return kept
+
+def trim_history(messages: list[BaseMessage], max_tokens: int) -> list[BaseMessage]:
+    """
+    Keeps the most recent turns of the conversation that fit in `max_tokens`.
+    The last message (the question being answered) is always kept.
+    """
+    trimmed = trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        token_counter=count_tokens_approximately,
+        strategy="last",
+        start_on="human",
+        include_system=True
+    )
+    return trimmed or list(messages[-1:])
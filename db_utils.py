@@ -1,17 +1,40 @@
+import itertools
 import sqlite3
 import uuid
-from llm_utils import generate_conversation_title
+from llm_utils import heuristic_title, TitleBatcher
+from sqlite_pool import DB_FILE, connection_manager
 
-DB_FILE = "db.sqlite"
+# Conversations listed per sidebar page
+CONVERSATIONS_PAGE_SIZE = 30
+
+
+class ConversationBusyError(Exception):
+    """Raised when a conversation is deleted while one of its research runs is queued or running."""
+
+
+# Bumped by every change to the conversations table, so that cached listings know when they are stale
+_conversations_version = itertools.count(1)
+_current_version = 0
+
+def conversations_version() -> int:
+    """Returns the version of the conversations table, it changes on create/rename/delete/touch."""
+    return _current_version
+
+def _bump_conversations_version():
+    global _current_version
+    _current_version = next(_conversations_version)
 
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
+    """
+    Returns the calling thread's pooled connection to the SQLite database (WAL mode, with a busy timeout).
+    Used as a context manager it commits, or rolls back on error, but stays open.
+    """
+    return connection_manager.get_connection()
 
 def initialize_db():
     """
     Initializes the database. Renames 'created_at' to 'used_at' if the old column exists,
-    then creates the 'conversations' table if it doesn't exist.
+    then creates the 'conversations', document store, search cache, transcript, trace, tool yield and job tables if they don't exist.
     """
     with get_db_connection() as conn:
         cursor = conn.cursor()
@@ -30,18 +53,133 @@ def initialize_db():
                 used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        # Serves the most-recently-used ordering and its cursors without sorting the whole table
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_used_at ON conversations (used_at DESC, thread_id DESC)")
+
+        # Shared cache of web and arXiv search results, see search_cache.py
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                tool TEXT NOT NULL,
+                query TEXT NOT NULL,
+                results TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (tool, query)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_used_at ON search_cache (last_used_at)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache_stats (
+                tool TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Content of graded documents, referenced by hash from the graph state, see document_store.py
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                hash TEXT PRIMARY KEY,
+                content TEXT NOT NULL
+            )
+        """)
+        # Per-thread log of the user and assistant messages, read to display a conversation
+        # without deserializing its checkpoints
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS transcript (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcript_thread_id ON transcript (thread_id, id)")
+        # One row per traced node invocation (see tracing.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS node_traces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                node TEXT NOT NULL,
+                question TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                duration_ms REAL NOT NULL,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0,
+                llm_calls INTEGER NOT NULL DEFAULT 0,
+                tool_calls INTEGER NOT NULL DEFAULT 0,
+                cache_hits INTEGER NOT NULL DEFAULT 0,
+                refinements INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_node_traces_thread_id ON node_traces (thread_id)")
+        # Graded searches, returned and relevant documents per query type and tool (see routing_policy.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tool_yield (
+                query_type TEXT NOT NULL,
+                tool TEXT NOT NULL,
+                searches INTEGER NOT NULL DEFAULT 0,
+                documents INTEGER NOT NULL DEFAULT 0,
+                relevant INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (query_type, tool)
+            )
+        """)
+        # Background research runs and their progress events (see job_runner.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                thread_id TEXT NOT NULL,
+                question TEXT NOT NULL,
+                status TEXT NOT NULL,
+                answer TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_thread_id ON jobs (thread_id, status)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job_id ON job_events (job_id, id)")
         conn.commit()
 
-def get_all_conversations():
+def list_conversations(limit: int = CONVERSATIONS_PAGE_SIZE, cursor: tuple | None = None, search: str | None = None):
     """
-    Retrieves all conversations from the 'conversations' table, ordered by most recently used.
+    Returns one page of conversations, most recently used first, and the cursor of the next page
+    (None on the last page). `cursor` is the (used_at, thread_id) of the last conversation of the
+    previous page. `search` keeps only the conversations whose title contains it.
     """
+    conditions, params = [], []
+    if cursor:
+        conditions.append("(used_at, thread_id) < (?, ?)")
+        params.extend(cursor)
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
     with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        # Order by the new 'used_at' column
-        cursor.execute("SELECT * FROM conversations ORDER BY used_at DESC")
-        return [dict(row) for row in cursor.fetchall()]
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
+        # Fetch one extra row to know whether there is a next page
+        cur.execute(
+            f"SELECT thread_id, name, used_at FROM conversations {where} "
+            "ORDER BY used_at DESC, thread_id DESC LIMIT ?",
+            (*params, limit + 1)
+        )
+        rows = [dict(row) for row in cur.fetchall()]
+    
+    page = rows[:limit]
+    next_cursor = (page[-1]["used_at"], page[-1]["thread_id"]) if len(rows) > limit else None
+    return page, next_cursor
 
 def create_new_conversation():
     """
@@ -57,6 +195,7 @@ def create_new_conversation():
             (thread_id, name)
         )
         conn.commit()
+    _bump_conversations_version()
     return thread_id, name
 
 def update_conversation_timestamp(thread_id: str):
@@ -71,22 +210,85 @@ def update_conversation_timestamp(thread_id: str):
             (thread_id,)
         )
         conn.commit()
+    _bump_conversations_version()
+
+def set_conversation_name(thread_id: str, name: str, previous: str | None = None) -> bool:
+    """
+    Sets the name of a conversation. With `previous`, only if the name is still `previous`.
+    Returns whether the conversation was renamed.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if previous is None:
+            cursor.execute("UPDATE conversations SET name = ? WHERE thread_id = ?", (name, thread_id))
+        else:
+            cursor.execute("UPDATE conversations SET name = ? WHERE thread_id = ? AND name = ?", (name, thread_id, previous))
+        conn.commit()
+        renamed = cursor.rowcount > 0
+    if renamed:
+        _bump_conversations_version()
+    return renamed
+
+def _apply_generated_title(key: tuple[str, str], title: str):
+    thread_id, heuristic_name = key
+    # Replace the heuristic title only, in case the conversation was renamed or deleted meanwhile
+    set_conversation_name(thread_id, title, previous=heuristic_name)
+
+# Generates the LLM titles of new conversations in batches, on a background thread
+title_batcher = TitleBatcher(_apply_generated_title)
 
 def rename_conversation(thread_id: str, query: str):
-    """Renames a conversation and updates its 'used_at' timestamp."""
+    """
+    Renames a conversation after its first query and updates its 'used_at' timestamp.
+    A heuristic title is set right away, the LLM title replaces it in the background.
+    """
     update_conversation_timestamp(thread_id) # Update timestamp on rename
-    new_name = generate_conversation_title(query=query)
+    new_name = heuristic_title(query)
+    set_conversation_name(thread_id, new_name)
+    title_batcher.submit((thread_id, new_name), query)
+    return new_name
+
+def get_transcript(thread_id: str) -> list[dict]:
+    """Returns the messages of a conversation in order, as dicts with 'role' ("user" or "assistant") and 'content'."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("UPDATE conversations SET name = ? WHERE thread_id = ?", (new_name, thread_id))
+        cursor.execute("SELECT role, content FROM transcript WHERE thread_id = ? ORDER BY id", (thread_id,))
+        return [{"role": role, "content": content} for role, content in cursor.fetchall()]
+
+def append_to_transcript(thread_id: str, messages: list[dict]):
+    """Appends messages ({'role', 'content'} dicts) to a conversation's transcript, called when a turn finishes."""
+    with get_db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO transcript (thread_id, role, content) VALUES (?, ?, ?)",
+            [(thread_id, msg["role"], msg["content"]) for msg in messages]
+        )
         conn.commit()
-    return new_name
 
 def delete_conversation(thread_id: str):
-    """Deletes a conversation from the 'conversations' and 'checkpoints' tables."""
+    """
+    Deletes a conversation from the 'conversations', 'transcript', 'node_traces', 'jobs', 'checkpoints' and 'writes' tables.
+    Raises ConversationBusyError while a research run of the conversation is queued or running,
+    its worker would write the rows back.
+    """
+    # Imported here, job_runner imports this module
+    from job_runner import ACTIVE_STATES
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # Take the write lock first, so no job can be queued between the check and the delete
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE thread_id = ? AND status IN ({', '.join('?' * len(ACTIVE_STATES))})",
+            (thread_id, *ACTIVE_STATES)
+        )
+        if cursor.fetchone()[0]:
+            raise ConversationBusyError("This conversation is still researching, delete it once the run has finished.")
         cursor.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        cursor.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        cursor.execute("DELETE FROM transcript WHERE thread_id = ?", (thread_id,))
+        cursor.execute("DELETE FROM node_traces WHERE thread_id = ?", (thread_id,))
+        cursor.execute("DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE thread_id = ?)", (thread_id,))
+        cursor.execute("DELETE FROM jobs WHERE thread_id = ?", (thread_id,))
         cursor.execute("DELETE FROM conversations WHERE thread_id = ?", (thread_id,))
         conn.commit()
+    _bump_conversations_version()
         
@@ -0,0 +1,33 @@
+import hashlib
+
+# Import from our local project files
+from db_utils import get_db_connection
+
+# The graph state only keeps document hashes, the content is stored once here,
+# however many checkpoints reference it
+
+def document_hash(content: str) -> str:
+    """Returns the key of a document, the SHA-256 of its content."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def store_documents(documents: list[str]) -> list[str]:
+    """Stores documents that are not stored yet and returns their hashes, in order."""
+    hashes = [document_hash(doc) for doc in documents]
+    if documents:
+        with get_db_connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO documents (hash, content) VALUES (?, ?)",
+                zip(hashes, documents)
+            )
+    return hashes
+
+def load_documents(hashes: list[str]) -> list[str]:
+    """Returns the content of the documents with the given hashes, in order. Unknown hashes are skipped."""
+    if not hashes:
+        return []
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(set(hashes)))
+        cursor.execute(f"SELECT hash, content FROM documents WHERE hash IN ({placeholders})", list(set(hashes)))
+        contents = dict(cursor.fetchall())
+    return [contents[h] for h in hashes if h in contents]
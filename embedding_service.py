@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Batch sizes remembered for the metrics
+METRICS_WINDOW = 1000
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Micro-batching front for a local embedding model. Requests from concurrent graph runs
+    are queued, and a worker thread collects them for up to `max_wait_ms` (or until
+    `max_batch_size` texts are waiting) and embeds them in one forward pass.
+    """
+
+    def __init__(self, underlying: Embeddings, max_batch_size: int, max_wait_ms: float):
+        self.underlying = underlying
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self._batches = 0
+        self._texts = 0
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def _submit(self, texts: list[str]) -> Future:
+        future = Future()
+        if texts:
+            self._queue.put((texts, future))
+        else:
+            future.set_result([])
+        return future
+
+    def _collect(self) -> list[tuple[list[str], Future]]:
+        """Blocks for a first request, then gathers more until the batch is full or the wait is over."""
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = self.underlying.embed_documents(texts)
+            except Exception as e:
+                logger.warning("Embedding a batch of %d texts failed: %s", len(texts), e)
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            
+            self._batches += 1
+            self._texts += len(texts)
+            self._batch_sizes.append(len(texts))
+            
+            start = 0
+            for request_texts, future in requests:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._submit(list(texts)).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.wrap_future(self._submit(list(texts)))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await asyncio.wrap_future(self._submit([text])))[0]
+
+    def metrics(self) -> dict:
+        """Returns the current queue depth and batch-size statistics over the last batches."""
+        sizes = list(self._batch_sizes)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self._batches,
+            "texts": self._texts,
+            "mean_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "max_batch_size": max(sizes, default=0)
+        }
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+# Import from our local project files
+from state import SourceGrade
+from config import get_llm, GRADER_MAX_CONCURRENCY, GRADER_TIMEOUT_SECONDS
+from llm_cache import cached_invoke, acached_invoke
+
+logger = logging.getLogger(__name__)
+
+# Verdict used when a document could not be graded (error, unparsable output or timeout).
+# Unverified documents are dropped instead of being passed on to the synthesizer.
+DEFAULT_GRADE = SourceGrade(related=False)
+
+# How often the engine checks running grades against the timeout
+POLL_INTERVAL_SECONDS = 0.05
+
+def build_grading_prompt(document: str, question: str) -> str:
+    """Builds the prompt asking the grader whether a document answers the question."""
+    return f"Is the following document relevant to the user's question? Document:\n\n{document}\n\nQuestion: {question}"
+
+def grade_documents(
+    documents: list[str],
+    question: str,
+    max_concurrency: int = GRADER_MAX_CONCURRENCY,
+    timeout: float = GRADER_TIMEOUT_SECONDS
+) -> list[SourceGrade]:
+    """
+    Grades all documents of a search round concurrently.
+    Returns one SourceGrade per document, in the same order as `documents`.
+    A document whose grade fails or takes longer than `timeout` seconds gets DEFAULT_GRADE,
+    the rest of the round is not affected.
+    """
+    if not documents:
+        return []
+
+    grader = get_llm().with_structured_output(SourceGrade)
+    grades = [DEFAULT_GRADE] * len(documents)
+    started_at = {}
+
+    def grade(index: int, document: str):
+        started_at[index] = time.monotonic()
+        # Verdicts of an unchanged (document, question) pair come from the response cache
+        return cached_invoke("grade", grader, build_grading_prompt(document, question))
+
+    # Workers run in a copy of the caller's context, so callbacks and trace counters reach them
+    executor = ContextThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(documents))))
+    try:
+        futures = {executor.submit(grade, index, doc): index for index, doc in enumerate(documents)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=POLL_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logger.warning("Grading document %d failed, using the default grade: %s", index, e)
+                    continue
+                if isinstance(response, SourceGrade):
+                    grades[index] = response
+                else:
+                    logger.warning("Grader returned no verdict for document %d, using the default grade.", index)
+
+            # Give up on grades that have been running for too long
+            now = time.monotonic()
+            for future in list(pending):
+                index = futures[future]
+                if index in started_at and now - started_at[index] > timeout:
+                    logger.warning("Grading document %d timed out after %.1fs, using the default grade.", index, timeout)
+                    pending.discard(future)
+    finally:
+        # Don't block on timed-out calls, their results are ignored anyway
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return grades
+
+async def agrade_documents(
+    documents: list[str],
+    question: str,
+    max_concurrency: int = GRADER_MAX_CONCURRENCY,
+    timeout: float = GRADER_TIMEOUT_SECONDS
+) -> list[SourceGrade]:
+    """
+    Async version of `grade_documents`, with the same ordering, concurrency cap,
+    per-document timeout and fallback to DEFAULT_GRADE.
+    """
+    if not documents:
+        return []
+
+    grader = get_llm().with_structured_output(SourceGrade)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def grade(index: int, document: str) -> SourceGrade:
+        async with semaphore:
+            try:
+                response = await asyncio.wait_for(
+                    acached_invoke("grade", grader, build_grading_prompt(document, question)),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Grading document %d timed out after %.1fs, using the default grade.", index, timeout)
+                return DEFAULT_GRADE
+            except Exception as e:
+                logger.warning("Grading document %d failed, using the default grade: %s", index, e)
+                return DEFAULT_GRADE
+        if isinstance(response, SourceGrade):
+            return response
+        logger.warning("Grader returned no verdict for document %d, using the default grade.", index)
+        return DEFAULT_GRADE
+
+    return list(await asyncio.gather(*(grade(index, doc) for index, doc in enumerate(documents))))
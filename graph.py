@@ -1,37 +1,78 @@
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.sqlite import SqliteSaver
-import sqlite3 
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 # Import from our local project files
+from config import GRAPH_MODE
+from sqlite_pool import connection_manager
+from state import new_question_state
+from tracing import traced_nodes
 from nodes import (
     refine_query_node,
+    refine_tools_node,
     web_search_node,
     arxiv_search_node,
     rag_search_node,
+    parallel_search_node,
     grade_and_filter_node,
+    budget_context_node,
     route_after_grading,
+    route_after_parallel_grading,
     route_after_refine,
+    fan_out_search,
     synthesizer_node,
     ResearchState
 )
+from async_nodes import (
+    arefine_query_node,
+    arefine_tools_node,
+    aweb_search_node,
+    aarxiv_search_node,
+    arag_search_node,
+    aparallel_search_node,
+    agrade_and_filter_node,
+    abudget_context_node,
+    asynthesizer_node
+)
 
-def create_graph():
-    """Builds and compiles the LangGraph agent."""
-    
-    graph = StateGraph(ResearchState)
-    
-    # Add all the nodes
-    graph.add_node("refine_query", refine_query_node)
-    graph.add_node("web_search", web_search_node)
-    graph.add_node("arxiv_search", arxiv_search_node)
-    graph.add_node("rag_search", rag_search_node)
-    graph.add_node("grade_and_filter", grade_and_filter_node)
-    graph.add_node("synthesize", synthesizer_node)
+GRAPH_MODES = ("sequential", "parallel")
+
+# Node implementations of the sync and async graphs, both share the same topology and routing.
+# Every node is traced when TRACING_ENABLED is set
+SYNC_NODES = traced_nodes({
+    "refine_query": refine_query_node,
+    "refine_tools": refine_tools_node,
+    "web_search": web_search_node,
+    "arxiv_search": arxiv_search_node,
+    "rag_search": rag_search_node,
+    "parallel_search": parallel_search_node,
+    "grade_and_filter": grade_and_filter_node,
+    "budget_context": budget_context_node,
+    "synthesize": synthesizer_node
+})
+ASYNC_NODES = traced_nodes({
+    "refine_query": arefine_query_node,
+    "refine_tools": arefine_tools_node,
+    "web_search": aweb_search_node,
+    "arxiv_search": aarxiv_search_node,
+    "rag_search": arag_search_node,
+    "parallel_search": aparallel_search_node,
+    "grade_and_filter": agrade_and_filter_node,
+    "budget_context": abudget_context_node,
+    "synthesize": asynthesizer_node
+})
+
+def add_sequential_search(graph: StateGraph, nodes: dict):
+    """
+    Searches one tool at a time (web -> arxiv -> rag, or the order of the adaptive routing policy),
+    refining the query of the active tool.
+    """
     
-    # Set the entry point
-    graph.set_entry_point("refine_query") # Start with the first search tool
+    graph.add_node("web_search", nodes["web_search"])
+    graph.add_node("arxiv_search", nodes["arxiv_search"])
+    graph.add_node("rag_search", nodes["rag_search"])
     
-        # Conditional edge after refining the query
+    # Conditional edge after refining the query
     graph.add_conditional_edges(
         "refine_query",
         route_after_refine,
@@ -53,17 +94,91 @@ def create_graph():
         route_after_grading,
         {
             "need_refine": "refine_query",
+            "web": "web_search",
             "arxiv": "arxiv_search",
             "rag": "rag_search",
-            "synthesize": "synthesize"
+            "synthesize": "budget_context"
         }  
     )
+
+def add_parallel_search(graph: StateGraph, nodes: dict):
+    """Searches all tools in one step, then refines and re-searches only the tools that came back empty."""
+    
+    search_nodes = ["web_search", "arxiv_search", "rag_search"]
+    for name in search_nodes:
+        graph.add_node(name, nodes["parallel_search"])
+        graph.add_edge(name, "grade_and_filter")
+    graph.add_node("refine_tools", nodes["refine_tools"])
+    
+    # Fan out to the tools after the first refinement and after every per-tool refinement
+    graph.add_conditional_edges("refine_query", fan_out_search, search_nodes)
+    graph.add_conditional_edges("refine_tools", fan_out_search, search_nodes)
+    
+    graph.add_conditional_edges(
+        "grade_and_filter",
+        route_after_parallel_grading,
+        {
+            "need_refine": "refine_tools",
+            "synthesize": "budget_context"
+        }
+    )
+
+def build_graph(mode: str, nodes: dict) -> StateGraph:
+    """Builds the uncompiled LangGraph agent with the given search topology and node implementations."""
+    
+    if mode not in GRAPH_MODES:
+        raise ValueError(f"Unknown graph mode '{mode}', expected one of {GRAPH_MODES}")
+    
+    graph = StateGraph(ResearchState)
+    
+    # Add the nodes shared by both topologies
+    graph.add_node("refine_query", nodes["refine_query"])
+    graph.add_node("grade_and_filter", nodes["grade_and_filter"])
+    graph.add_node("budget_context", nodes["budget_context"])
+    graph.add_node("synthesize", nodes["synthesize"])
     
+    # Set the entry point
+    graph.set_entry_point("refine_query") # Start by refining the user's query
+    
+    if mode == "parallel":
+        add_parallel_search(graph, nodes)
+    else:
+        add_sequential_search(graph, nodes)
+    
+    # Fit the documents and history into the context budget before synthesizing
+    graph.add_edge("budget_context", "synthesize")
     graph.add_edge("synthesize", END)
     
-    # Create connection and memory
-    sqlite_conn = sqlite3.connect("db.sqlite", check_same_thread = False)
-    memory = SqliteSaver(conn = sqlite_conn)
+    return graph
+
+def create_graph(mode: str = GRAPH_MODE):
+    """Builds and compiles the LangGraph agent with the given search topology."""
+    
+    graph = build_graph(mode, SYNC_NODES)
+    
+    # Create memory on the connection shared with the rest of the app
+    memory = SqliteSaver(conn = connection_manager.get_shared_connection())
     
     # compile the graph
     return graph.compile(checkpointer=memory)
+
+async def create_async_graph(mode: str = GRAPH_MODE):
+    """
+    Builds and compiles the async LangGraph agent. Its nodes await network I/O and
+    its checkpointer is async, so one event loop can serve many research sessions.
+    """
+    
+    graph = build_graph(mode, ASYNC_NODES)
+    
+    memory = AsyncSqliteSaver(conn = await connection_manager.aconnect())
+    
+    return graph.compile(checkpointer=memory)
+
+async def astream_research(app, question: str, thread_id: str, stream_mode="updates"):
+    """
+    Async entry point: runs one research question on the thread of `thread_id`
+    with a graph from `create_async_graph`, yielding its stream events.
+    """
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 50}
+    async for event in app.astream(new_question_state(question), config=config, stream_mode=stream_mode):
+        yield event
@@ -0,0 +1,83 @@
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+# Import from our local project files
+from state import ResearchState
+from config import get_llm, HISTORY_VERBATIM_TURNS, HISTORY_MAX_MESSAGE_CHARS
+from llm_cache import invoke_llm, ainvoke_llm
+
+def conversation_messages(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """Returns the user and assistant messages of the history, without tool or system messages."""
+    return [msg for msg in messages if isinstance(msg, (HumanMessage, AIMessage))]
+
+def role_of(message: BaseMessage) -> str:
+    return "User" if isinstance(message, HumanMessage) else "Assistant"
+
+def render_messages(messages: list[BaseMessage], max_chars: int = HISTORY_MAX_MESSAGE_CHARS) -> str:
+    """Renders messages as 'Role: content' lines, without ids or metadata."""
+    lines = []
+    for msg in messages:
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        if len(content) > max_chars:
+            content = content[:max_chars] + " [...]"
+        lines.append(f"{role_of(msg)}: {content}")
+    return "\n".join(lines)
+
+def split_history(state: ResearchState) -> tuple[list[BaseMessage], list[BaseMessage]]:
+    """
+    Splits the conversation into the messages that still have to be folded into the summary
+    and the last HISTORY_VERBATIM_TURNS turns, which are kept verbatim.
+    """
+    messages = conversation_messages(state['messages'])
+    verbatim_start = max(0, len(messages) - 2 * HISTORY_VERBATIM_TURNS)
+    summarized_count = min(state.get('history_summarized_count', 0), verbatim_start)
+    return messages[summarized_count:verbatim_start], messages[verbatim_start:]
+
+def build_summary_prompt(summary: str, messages: list[BaseMessage]) -> str:
+    """Builds the prompt folding older messages into the rolling summary."""
+    return (
+        "You maintain a running summary of a research conversation. Update the summary with the new messages below. "
+        "Keep every topic, entity, paper and technical term the user may refer back to. "
+        "Write at most 150 words and return ONLY the updated summary.\n\n"
+        f"--- CURRENT SUMMARY ---\n{summary or '(empty)'}\n\n"
+        f"--- NEW MESSAGES ---\n{render_messages(messages)}\n\n"
+        "Updated summary:"
+    )
+
+def summary_update(state: ResearchState) -> ResearchState:
+    """
+    Folds the messages that left the verbatim window into the rolling summary.
+    Returns the state update, empty if the summary is already up to date.
+    """
+    to_summarize, _ = split_history(state)
+    if not to_summarize:
+        return {}
+    
+    response = invoke_llm(get_llm(), build_summary_prompt(state.get('history_summary', ''), to_summarize))
+    return {
+        "history_summary": response.content.strip(),
+        "history_summarized_count": state.get('history_summarized_count', 0) + len(to_summarize)
+    }
+
+async def asummary_update(state: ResearchState) -> ResearchState:
+    """Async version of `summary_update`."""
+    to_summarize, _ = split_history(state)
+    if not to_summarize:
+        return {}
+    
+    response = await ainvoke_llm(get_llm(), build_summary_prompt(state.get('history_summary', ''), to_summarize))
+    return {
+        "history_summary": response.content.strip(),
+        "history_summarized_count": state.get('history_summarized_count', 0) + len(to_summarize)
+    }
+
+def render_history(state: ResearchState) -> str:
+    """
+    Renders the conversation for a prompt: the rolling summary of older turns followed by
+    the recent turns verbatim. Its size is bounded whatever the length of the thread.
+    """
+    _, recent = split_history(state)
+    parts = []
+    if state.get('history_summary'):
+        parts.append(f"Summary of the earlier conversation: {state['history_summary']}")
+    parts.append(render_messages(recent))
+    return "\n\n".join(parts)
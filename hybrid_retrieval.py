@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import sqlite3
+from typing import Any
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Import from our local project files
+from config import HYBRID_CANDIDATES, RETRIEVER_K, SPARSE_MIN_BM25
+from rag_setup import iter_collection
+
+logger = logging.getLogger(__name__)
+
+SPARSE_INDEX_FILE = "sparse_index.sqlite"
+
+# Damping constant of reciprocal rank fusion, 60 is the value from the original paper
+RRF_K = 60
+# BM25 weight of the title column relative to the abstract
+TITLE_WEIGHT = 2.0
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Terms left out of keyword queries, they match nearly every abstract
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "has", "have",
+    "how", "in", "into", "is", "it", "its", "of", "on", "or", "that", "the", "their", "this", "to",
+    "using", "via", "was", "what", "when", "where", "which", "who", "why", "with", "about", "between",
+    "me", "give", "show", "find", "paper", "papers", "recent", "latest", "research"
+}
+
+def build_sparse_index(collection, path: str = SPARSE_INDEX_FILE):
+    """Builds the BM25 keyword index (SQLite FTS5) over the titles and abstracts stored in Chroma."""
+    total = collection.count()
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE IF EXISTS papers")
+        conn.execute("CREATE VIRTUAL TABLE papers USING fts5(title, content, tokenize='porter unicode61')")
+        indexed = 0
+        for batch in iter_collection(collection, ["documents", "metadatas"]):
+            conn.executemany(
+                "INSERT INTO papers (title, content) VALUES (?, ?)",
+                [((meta or {}).get("title", ""), doc) for doc, meta in zip(batch["documents"], batch["metadatas"])]
+            )
+            indexed += len(batch["documents"])
+            logger.info("Indexed %d/%d abstracts for keyword search", indexed, total)
+        conn.execute("INSERT INTO papers (papers) VALUES ('optimize')")
+
+def to_match_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query matching any of its content terms, quoted so that no term is
+    read as an operator. Stopwords and single characters are dropped, an empty string means nothing to match.
+    """
+    tokens = [token for token in TOKEN_PATTERN.findall(query.lower()) if len(token) > 1 and token not in STOPWORDS]
+    return " OR ".join(f'"{token}"' for token in dict.fromkeys(tokens))
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int = RRF_K) -> list[Document]:
+    """Fuses ranked lists of documents, a document scores 1 / (k + rank) in every list it appears in."""
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(doc.page_content, doc)
+    return [documents[content] for content in sorted(scores, key=scores.get, reverse=True)]
+
+
+class SparseRetriever(BaseRetriever):
+    """BM25 keyword search over the FTS5 index, title matches weigh more than abstract matches."""
+
+    path: str = SPARSE_INDEX_FILE
+    k: int = HYBRID_CANDIDATES
+    min_score: float = SPARSE_MIN_BM25
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        match_query = to_match_query(query)
+        if not match_query:
+            return []
+        with sqlite3.connect(self.path) as conn:
+            # bm25() is lower for better matches, weak matches on a single common term are cut off
+            rows = conn.execute(
+                f"SELECT title, content FROM papers WHERE papers MATCH ? AND bm25(papers, {TITLE_WEIGHT}, 1.0) <= ? "
+                f"ORDER BY bm25(papers, {TITLE_WEIGHT}, 1.0) LIMIT ?",
+                (match_query, -self.min_score, self.k)
+            ).fetchall()
+        return [Document(page_content=content, metadata={"title": title}) for title, content in rows]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses dense and keyword results with reciprocal rank fusion. Exact technical terms and acronyms
+    that embed poorly are still found by the keyword index. An optional reranker (a LangChain document
+    compressor, e.g. a cross-encoder) reorders the fused candidates before the top `k` are kept.
+    """
+
+    dense: BaseRetriever
+    sparse: BaseRetriever
+    reranker: Any = None
+    k: int = RETRIEVER_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        callbacks = run_manager.get_child()
+        fused = reciprocal_rank_fusion([
+            self.dense.invoke(query, config={"callbacks": callbacks}),
+            self.sparse.invoke(query, config={"callbacks": callbacks})
+        ])
+        if self.reranker is not None and fused:
+            fused = list(self.reranker.compress_documents(fused, query))
+        return fused[:self.k]
+
+
+def create_hybrid_retriever(dense: BaseRetriever, collection, reranker_model: str = "") -> HybridRetriever:
+    """Wraps a dense retriever into a hybrid one, building the keyword index from the Chroma store if needed."""
+    if not os.path.exists(SPARSE_INDEX_FILE):
+        build_sparse_index(collection)
+    
+    reranker = None
+    if reranker_model:
+        # Imported here, the cross-encoder is only loaded when reranking is enabled
+        from langchain.retrievers.document_compressors import CrossEncoderReranker
+        from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+        reranker = CrossEncoderReranker(model=HuggingFaceCrossEncoder(model_name=reranker_model), top_n=HYBRID_CANDIDATES)
+    
+    return HybridRetriever(dense=dense, sparse=SparseRetriever(), reranker=reranker)
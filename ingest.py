@@ -0,0 +1,337 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Iterator
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+# Import from our local project files
+from config import EMBEDDING_MODEL_NAME, RAG_CORPUS_SIZE
+
+logger = logging.getLogger(__name__)
+
+CHROMA_PATH = "chroma_db"
+EMBEDDING_CACHE_PATH = "embedding_cache"
+DATASET_NAME = "CShorten/ML-ArXiv-Papers"
+DATASET_SPLIT = "train"
+# Row ranges already ingested from every source, so a rerun skips them without embedding
+MANIFEST_FILE = os.path.join(CHROMA_PATH, "ingest_manifest.json")
+
+# Rows written to Chroma per step, kept below Chroma's maximum batch size
+INGEST_CHUNK_SIZE = 5000
+# Texts per forward pass on each embedding worker process
+EMBED_BATCH_SIZE = 256
+
+def content_hash(text: str) -> str:
+    """Returns the id of a document, the SHA-256 of its content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class PooledEmbeddings(Embeddings):
+    """
+    Encodes documents on one pool of worker processes, started on the first call and reused for
+    every chunk until close(). HuggingFaceEmbeddings(multi_process=True) would start a pool, and
+    load the model in every worker, on each call. Texts are prepared like HuggingFaceEmbeddings
+    does, so the vectors match the ones of queries embedded by the app.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = EMBED_BATCH_SIZE):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
+        self._pool = None
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool()
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.model.encode(text.replace("\n", " ")).tolist()
+
+    def close(self):
+        """Stops the worker processes, if they were started."""
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+def get_ingestion_embeddings(underlying: Embeddings) -> CacheBackedEmbeddings:
+    """
+    Returns the embedder used for bulk ingestion. It encodes with `underlying` (a PooledEmbeddings)
+    and keeps every vector in an on-disk cache keyed by the hash of the text,
+    so an abstract is only ever embedded once.
+    """
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(EMBEDDING_CACHE_PATH),
+        namespace=EMBEDDING_MODEL_NAME,
+        batch_size=INGEST_CHUNK_SIZE,
+        key_encoder="sha256"
+    )
+
+def iter_source_rows(source: str, chunk_size: int, revision: str | None = None) -> Iterator[dict]:
+    """
+    Streams {'title', 'abstract'} rows from a Hugging Face dataset name (at `revision`), a local
+    Parquet file or a local JSONL file. Only about one chunk is held in memory at a time.
+    """
+    if source.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=["title", "abstract"]):
+            yield from batch.to_pylist()
+    elif source.endswith((".jsonl", ".json")):
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield {"title": row.get("title", ""), "abstract": row.get("abstract", "")}
+    else:
+        from datasets import load_dataset
+        yield from load_dataset(source, split=DATASET_SPLIT, streaming=True, revision=revision)
+
+def dataset_revision(source: str) -> str:
+    """The latest commit of a Hugging Face dataset, looked up on the Hub."""
+    from huggingface_hub import HfApi
+    return HfApi().dataset_info(source).sha
+
+def source_key(source: str, revision: str | None = None) -> str:
+    """
+    Identifies a source in the manifest. A local file that changed counts as a new source,
+    and so does a new commit of a Hugging Face dataset.
+    """
+    if os.path.isfile(source):
+        stat = os.stat(source)
+        return f"{os.path.abspath(source)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return f"{source}@{revision}:{DATASET_SPLIT}"
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict):
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    temporary = f"{MANIFEST_FILE}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, MANIFEST_FILE)
+
+def add_range(ranges: list[list[int]], start: int, end: int) -> list[list[int]]:
+    """Adds [start, end) to a list of row ranges, merging overlapping and adjacent ones."""
+    merged = []
+    for low, high in sorted(ranges + [[start, end]]):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+def is_covered(ranges: list[list[int]], start: int, end: int) -> bool:
+    return any(low <= start and end <= high for low, high in ranges)
+
+def covers(entry: dict, rows: int | None) -> bool:
+    """Whether a manifest entry covers the first `rows` rows (all rows if None), or all rows of a shorter source."""
+    total = entry.get("total_rows")
+    if rows is None or (total is not None and total < rows):
+        rows = total
+    return rows is not None and is_covered(entry["ranges"], 0, rows)
+
+def manifest_revision(manifest: dict, source: str) -> str | None:
+    """The dataset commit the latest manifest entry of a Hugging Face `source` was ingested from."""
+    entries = [entry for entry in manifest.values() if entry.get("source") == source and entry.get("revision")]
+    return max(entries, key=lambda entry: entry.get("updated_at", 0))["revision"] if entries else None
+
+def resolve_revision(source: str, manifest: dict) -> str | None:
+    """
+    The latest commit of a Hugging Face `source` (None for local files). If the Hub can't be
+    reached, the commit already ingested is used, if there is one.
+    """
+    if os.path.isfile(source):
+        return None
+    try:
+        return dataset_revision(source)
+    except Exception as e:
+        revision = manifest_revision(manifest, source)
+        if revision is None:
+            raise
+        logger.warning("Could not look up the latest commit of '%s' (%s), using the ingested commit %s.", source, e, revision)
+        return revision
+
+def is_ingested(rows: int | None, source: str = DATASET_NAME) -> bool:
+    """
+    Whether the manifest shows the first `rows` rows of `source` as ingested. Reads only the local
+    manifest, a Hugging Face source is checked at the commit it was ingested from.
+    """
+    manifest = load_manifest()
+    if os.path.isfile(source):
+        key = source_key(source)
+    else:
+        revision = manifest_revision(manifest, source)
+        if revision is None:
+            return False
+        key = source_key(source, revision)
+    return key in manifest and covers(manifest[key], rows)
+
+def is_content_hash_store(db) -> bool:
+    """Whether the store's documents use content-hash ids, which incremental updates rely on."""
+    ids = db.get(limit=1, include=[])["ids"]
+    return not ids or (len(ids[0]) == 64 and all(c in "0123456789abcdef" for c in ids[0]))
+
+def upsert_chunk(db, rows: list[dict]) -> tuple[int, int]:
+    """
+    Writes the new and changed papers of a chunk. A paper is identified by its title.
+    Documents are stored under their content hash, so an unchanged abstract is skipped. A changed
+    abstract replaces the stored version with the same title. Returns the (added, updated) counts.
+    """
+    # Deduplicate by title then by content, the same paper can appear more than once in a dump
+    by_title = {}
+    for row in rows:
+        if row.get("abstract"):
+            by_title[row.get("title") or content_hash(row["abstract"])] = row
+    docs = {content_hash(row["abstract"]): row for row in by_title.values()}
+    
+    existing = set(db.get(ids=list(docs), include=[])["ids"]) if docs else set()
+    new_ids = [doc_id for doc_id in docs if doc_id not in existing]
+    if not new_ids:
+        return 0, 0
+    
+    # Older versions of the new abstracts: same title, different content
+    titles = list({docs[doc_id]["title"] for doc_id in new_ids if docs[doc_id]["title"]})
+    stale = db.get(where={"title": {"$in": titles}}, include=["metadatas"]) if titles else {"ids": [], "metadatas": []}
+    stale_ids, replaced_titles = [], set()
+    for doc_id, meta in zip(stale["ids"], stale["metadatas"]):
+        if doc_id not in docs:
+            stale_ids.append(doc_id)
+            replaced_titles.add((meta or {}).get("title"))
+    if stale_ids:
+        db.delete(ids=stale_ids)
+    
+    db.add_texts(
+        texts=[docs[doc_id]["abstract"] for doc_id in new_ids],
+        metadatas=[{"title": docs[doc_id]["title"]} for doc_id in new_ids],
+        ids=new_ids
+    )
+    updated = sum(1 for doc_id in new_ids if docs[doc_id]["title"] in replaced_titles)
+    return len(new_ids) - updated, updated
+
+def invalidate_derived_indexes():
+    """Deletes the keyword and FAISS indexes built from the store, they are rebuilt from it on the next start."""
+    from hybrid_retrieval import SPARSE_INDEX_FILE
+    paths = [SPARSE_INDEX_FILE]
+    try:
+        from vector_index import ANN_INDEX_PATH
+        paths.append(ANN_INDEX_PATH)
+    except ImportError:
+        # faiss isn't installed, so there is no ANN index either
+        pass
+    
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        else:
+            continue
+        logger.info("Removed '%s', it is rebuilt from the updated store on the next start.", path)
+
+def ingest_arxiv_corpus(
+    rows: int | None = RAG_CORPUS_SIZE,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    source: str = DATASET_NAME,
+    revision: str | None = None
+) -> dict[str, int]:
+    """
+    Streams the first `rows` papers of `source` (all of them if None) into the Chroma store, chunk by chunk,
+    so memory use doesn't grow with the corpus. Only new and changed papers are embedded and written.
+    The row ranges done are recorded in the manifest, so an interrupted run resumes where it stopped and a
+    rerun over the same source skips what it already ingested.
+    A Hugging Face source is read at `revision`, by default the commit already ingested, so only a first
+    build looks the latest one up.
+    Returns the number of papers added and updated, and of rows skipped through the manifest.
+    """
+    manifest = load_manifest()
+    is_dataset = not os.path.isfile(source)
+    if revision is None and is_dataset:
+        revision = manifest_revision(manifest, source)
+    ingested = manifest.get(source_key(source, revision)) if revision is not None or not is_dataset else None
+    if ingested and covers(ingested, rows):
+        total = ingested.get("total_rows")
+        return {"added": 0, "updated": 0, "skipped": total if rows is None or (total is not None and total < rows) else rows}
+    
+    # One pool of embedding workers serves every chunk of the run
+    embeddings = PooledEmbeddings(EMBEDDING_MODEL_NAME)
+    try:
+        db = Chroma(persist_directory=CHROMA_PATH, embedding_function=get_ingestion_embeddings(embeddings))
+        if not is_content_hash_store(db):
+            logger.warning(
+                "The store in '%s' was not built with content-hash ids and can't be updated incrementally. "
+                "Delete it to rebuild.", CHROMA_PATH
+            )
+            return {"added": 0, "updated": 0, "skipped": 0}
+        
+        # Only a first build of a Hugging Face source has to look its commit up
+        if revision is None and is_dataset:
+            revision = resolve_revision(source, manifest)
+        # The rows are streamed from the same dataset commit the manifest entry is keyed by
+        entry = manifest.setdefault(source_key(source, revision), {"ranges": []})
+        entry.update(source=source, revision=revision)
+        
+        stats = {"added": 0, "updated": 0, "skipped": 0}
+        started_at = time.monotonic()
+        source_rows = iter_source_rows(source, chunk_size, revision)
+        if rows is not None:
+            source_rows = itertools.islice(source_rows, rows)
+        
+        start = 0
+        while chunk := list(itertools.islice(source_rows, chunk_size)):
+            end = start + len(chunk)
+            if is_covered(entry["ranges"], start, end):
+                stats["skipped"] += len(chunk)
+            else:
+                added, updated = upsert_chunk(db, chunk)
+                stats["added"] += added
+                stats["updated"] += updated
+                entry["ranges"] = add_range(entry["ranges"], start, end)
+                entry["updated_at"] = time.time()
+                save_manifest(manifest)
+        
+            elapsed = time.monotonic() - started_at
+            logger.info(
+                "Ingested rows %d-%d (%d added, %d updated so far) - %.1f rows/s",
+                start, end, stats["added"], stats["updated"], end / elapsed if elapsed else 0.0
+            )
+            start = end
+        
+        if rows is None or start < rows:
+            # The source ran out, later runs asking for more rows have nothing left to read
+            entry["total_rows"] = start
+            save_manifest(manifest)
+        
+        if stats["added"] or stats["updated"]:
+            invalidate_derived_indexes()
+        return stats
+    finally:
+        embeddings.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the arXiv RAG store.")
+    parser.add_argument("--source", default=DATASET_NAME, help="Hugging Face dataset name, or a local .parquet/.jsonl dump.")
+    parser.add_argument("--rows", type=int, default=RAG_CORPUS_SIZE, help="Number of source rows to ingest.")
+    parser.add_argument("--all", action="store_true", help="Ingest every row of the source, ignoring --rows.")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="Rows written per step.")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # The command line picks up the latest commit of a Hugging Face dataset, the app keeps the ingested one
+    revision = resolve_revision(args.source, load_manifest())
+    stats = ingest_arxiv_corpus(rows=None if args.all else args.rows, chunk_size=args.chunk_size, source=args.source, revision=revision)
+    print(f"Added {stats['added']} and updated {stats['updated']} documents in '{CHROMA_PATH}', skipped {stats['skipped']} rows already ingested.")
@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Import from our local project files
+from config import LazyProvider, JOB_WORKERS, JOB_MAX_PENDING
+from state import new_question_state
+import db_utils
+from db_utils import get_db_connection
+from checkpoint_maintenance import prune_thread
+
+logger = logging.getLogger(__name__)
+
+# Job states, a job is "active" until it is done or failed
+QUEUED, RUNNING, DONE, FAILED, INTERRUPTED = "queued", "running", "done", "failed", "interrupted"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# Streamed answer tokens are written in chunks at most this often, not one row per token
+ANSWER_FLUSH_SECONDS = 0.2
+
+
+class QueueFullError(Exception):
+    """Raised when a question is submitted while the admission limit of queued and running jobs is reached."""
+
+
+def create_job(job_id: str, thread_id: str, question: str):
+    with get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO jobs (job_id, thread_id, question, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, thread_id, question, QUEUED, time.time())
+        )
+        conn.commit()
+
+def set_job_status(job_id: str, status: str, answer: str | None = None, error: str | None = None):
+    with get_db_connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, answer = COALESCE(?, answer), error = ?, updated_at = ? WHERE job_id = ?",
+            (status, answer, error, time.time(), job_id)
+        )
+        conn.commit()
+
+def add_event(job_id: str, kind: str, data: str):
+    """Persists a progress event: kind "node" (a node finished, data is its name) or "answer" (answer text)."""
+    with get_db_connection() as conn:
+        conn.execute("INSERT INTO job_events (job_id, kind, data) VALUES (?, ?, ?)", (job_id, kind, data))
+        conn.commit()
+
+def get_job(job_id: str) -> dict | None:
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT job_id, thread_id, question, status, answer, error FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+    keys = ("job_id", "thread_id", "question", "status", "answer", "error")
+    return dict(zip(keys, row)) if row else None
+
+def get_events(job_id: str, after_id: int = 0) -> list[tuple[int, str, str]]:
+    """Returns the (id, kind, data) events of a job newer than `after_id`, in order."""
+    with get_db_connection() as conn:
+        return conn.execute(
+            "SELECT id, kind, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, after_id)
+        ).fetchall()
+
+def active_jobs(thread_id: str) -> list[dict]:
+    """Returns the queued and running jobs of a thread, oldest first, so the UI can reattach to them."""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            f"SELECT job_id FROM jobs WHERE thread_id = ? AND status IN ({', '.join('?' * len(ACTIVE_STATES))}) ORDER BY created_at",
+            (thread_id, *ACTIVE_STATES)
+        ).fetchall()
+    return [get_job(job_id) for job_id, in rows]
+
+def interrupt_stale_jobs():
+    with get_db_connection() as conn:
+        conn.execute(
+            f"UPDATE jobs SET status = ?, updated_at = ? WHERE status IN ({', '.join('?' * len(ACTIVE_STATES))})",
+            (INTERRUPTED, time.time(), *ACTIVE_STATES)
+        )
+        conn.commit()
+
+
+class JobRunner:
+    """
+    Runs research questions in the background on a worker pool, with one compiled graph shared by
+    every browser session. Jobs of the same conversation thread run one at a time in submission
+    order (single flight per thread), jobs of different threads run concurrently.
+    Progress is persisted in `job_events`, so any session can follow a job by its id.
+    """
+
+    def __init__(self, graph_factory, max_workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING):
+        self.graph = LazyProvider(graph_factory)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="research-job")
+        self._lock = threading.Lock()
+        self._running_threads = set()
+        self._waiting = defaultdict(deque)
+        self._pending = 0
+        self._running = 0
+        self._started = False
+
+    def start(self):
+        """
+        Called on every run of the app script, only the first call does something: jobs left
+        active by a previous process are marked interrupted, nothing is running them anymore.
+        """
+        with self._lock:
+            if not self._started:
+                interrupt_stale_jobs()
+                self._started = True
+
+    def submit(self, thread_id: str, question: str) -> str:
+        """
+        Queues a question on a conversation thread and returns the job id.
+        Raises QueueFullError when `max_pending` jobs are already queued or running.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} research runs are already queued, try again shortly.")
+            job_id = str(uuid.uuid4())
+            create_job(job_id, thread_id, question)
+            self._pending += 1
+            if thread_id in self._running_threads:
+                # Single flight: the question waits for the running job of its thread
+                self._waiting[thread_id].append((job_id, question))
+            else:
+                self._running_threads.add(thread_id)
+                self._executor.submit(self._run, job_id, thread_id, question)
+        return job_id
+
+    def stats(self) -> dict:
+        """Queue depth gauge: running jobs, and admitted jobs waiting for a worker or for their thread."""
+        with self._lock:
+            return {
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "max_pending": self.max_pending
+            }
+
+    def _run(self, job_id: str, thread_id: str, question: str):
+        with self._lock:
+            self._running += 1
+        try:
+            self._execute(job_id, thread_id, question)
+        except Exception as e:
+            logger.exception("Research job %s failed", job_id)
+            set_job_status(job_id, FAILED, error=str(e))
+        finally:
+            self._finish(thread_id)
+
+    def _finish(self, thread_id: str):
+        """Releases the job's admission slot and starts the next question of the thread, if any."""
+        with self._lock:
+            self._pending -= 1
+            self._running -= 1
+            waiting = self._waiting.get(thread_id)
+            if waiting:
+                job_id, question = waiting.popleft()
+                self._executor.submit(self._run, job_id, thread_id, question)
+            else:
+                self._waiting.pop(thread_id, None)
+                self._running_threads.discard(thread_id)
+
+    def _execute(self, job_id: str, thread_id: str, question: str):
+        set_job_status(job_id, RUNNING)
+        config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 50}
+
+        final_answer, streamed, buffer, last_flush = None, [], [], time.monotonic()
+        for mode, chunk in self.graph.get().stream(new_question_state(question), config=config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message, metadata = chunk
+                if metadata.get("langgraph_node") == "synthesize" and message.content:
+                    buffer.append(message.content)
+                    if time.monotonic() - last_flush >= ANSWER_FLUSH_SECONDS:
+                        add_event(job_id, "answer", "".join(buffer))
+                        streamed.extend(buffer)
+                        buffer, last_flush = [], time.monotonic()
+                continue
+
+            for node, output in chunk.items():
+                add_event(job_id, "node", node)
+                if node == "synthesize" and output:
+                    messages = output.get("messages")
+                    if isinstance(messages, list):
+                        messages = messages[-1] if messages else None
+                    if messages is not None:
+                        final_answer = messages.content
+
+        if buffer:
+            add_event(job_id, "answer", "".join(buffer))
+            streamed.extend(buffer)
+
+        # Nothing was streamed when the answer didn't come from the LLM (e.g. no documents were found)
+        answer = "".join(streamed) or final_answer or "The agent finished without providing a final answer."
+        if not streamed:
+            add_event(job_id, "answer", answer)
+
+        # Log the finished turn and keep only the latest checkpoints of the thread
+        db_utils.append_to_transcript(thread_id, [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer}
+        ])
+        prune_thread(thread_id)
+        set_job_status(job_id, DONE, answer=answer)
+
+
+def _create_graph():
+    from graph import create_graph
+    return create_graph()
+
+# Shared by every session of the app process
+job_runner = JobRunner(_create_graph)
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any
+
+# Import from our local project files
+from config import (
+    get_embedding_function,
+    LLM_CACHE_SITES,
+    LLM_SEMANTIC_CACHE_SITES,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_SEMANTIC_CACHE_THRESHOLD
+)
+import tracing
+
+logger = logging.getLogger(__name__)
+
+def prompt_hash(site: str, prompt: str) -> str:
+    """Returns the exact-match key of a prompt sent from a call site."""
+    return hashlib.sha256(f"{site}\x00{prompt}".encode("utf-8")).hexdigest()
+
+def normalize(vector: list[float]) -> np.ndarray:
+    """Returns the unit vector of an embedding, so that dot products are cosine similarities."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class LLMResponseCache:
+    """
+    Two-tier, in-memory cache of LLM responses, both tiers bounded by LRU eviction.
+    The exact tier is keyed by prompt hash. The optional semantic tier embeds a text describing
+    the prompt and serves the response of the most similar cached text of the same call site,
+    if its similarity is above the threshold.
+    """
+
+    def __init__(self, max_entries: int, similarity_threshold: float, get_embeddings=None):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        # Called only when the semantic tier is used, so the embedder is not loaded otherwise
+        self.get_embeddings = get_embeddings
+        self._exact = OrderedDict()
+        self._semantic = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def lookup(self, site: str, prompt: str, semantic_text: str | None = None) -> Any | None:
+        """Returns the cached response of a prompt, or None. The semantic tier is only used if `semantic_text` is given."""
+        key = prompt_hash(site, prompt)
+        with self._lock:
+            if key in self._exact:
+                self._exact.move_to_end(key)
+                self.hits["exact"] += 1
+                return self._exact[key]
+        
+        if semantic_text is not None and self.get_embeddings is not None:
+            vector = normalize(self.get_embeddings().embed_query(semantic_text))
+            with self._lock:
+                candidates = [(k, entry) for k, entry in self._semantic.items() if entry[0] == site]
+                if candidates:
+                    scores = np.stack([entry[1] for _, entry in candidates]) @ vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        best_key = candidates[best][0]
+                        self._semantic.move_to_end(best_key)
+                        self.hits["semantic"] += 1
+                        return self._semantic[best_key][2]
+        
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, site: str, prompt: str, response: Any, semantic_text: str | None = None):
+        """Stores a response in the exact tier, and in the semantic tier if `semantic_text` is given."""
+        key = prompt_hash(site, prompt)
+        vector = None
+        if semantic_text is not None and self.get_embeddings is not None:
+            vector = normalize(self.get_embeddings().embed_query(semantic_text))
+        
+        with self._lock:
+            self._exact[key] = response
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+            
+            if vector is not None:
+                self._semantic[key] = (site, vector, response)
+                self._semantic.move_to_end(key)
+                while len(self._semantic) > self.max_entries:
+                    self._semantic.popitem(last=False)
+
+    def clear(self):
+        """Drops every cached response, e.g. between runs that must not share them."""
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+
+
+llm_cache = LLMResponseCache(
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    similarity_threshold=LLM_SEMANTIC_CACHE_THRESHOLD,
+    get_embeddings=get_embedding_function
+)
+
+def cache_keys(site: str, prompt: str, cache_key: str, semantic_text: str | None) -> tuple[str, str | None]:
+    """Returns the exact-tier key text and the semantic-tier text (None if the site has no semantic tier)."""
+    key_prompt = f"{cache_key}\n{prompt}" if cache_key else prompt
+    if site in LLM_SEMANTIC_CACHE_SITES:
+        return key_prompt, f"{cache_key}\n{semantic_text or prompt}"
+    return key_prompt, None
+
+def invoke_llm(runnable, prompt):
+    """Invokes an LLM call that bypasses the response cache. Every LLM call goes through here or `ainvoke_llm`, so traces count them all."""
+    tracing.count("llm_calls")
+    return runnable.invoke(prompt)
+
+async def ainvoke_llm(runnable, prompt):
+    """Async version of `invoke_llm`."""
+    tracing.count("llm_calls")
+    return await runnable.ainvoke(prompt)
+
+def cached_invoke(site: str, runnable, prompt: str, cache_key: str = "", semantic_text: str | None = None):
+    """
+    Invokes `runnable` with `prompt` through the response cache, if caching is enabled for `site`.
+    `cache_key` is added to the exact key for calls that must not share a response despite
+    having the same prompt, e.g. successive refinement attempts. `semantic_text` is the text
+    compared by the semantic tier (the prompt itself if not given).
+    """
+    if site not in LLM_CACHE_SITES:
+        return invoke_llm(runnable, prompt)
+    
+    key_prompt, semantic_text = cache_keys(site, prompt, cache_key, semantic_text)
+    try:
+        response = llm_cache.lookup(site, key_prompt, semantic_text=semantic_text)
+    except Exception as e:
+        logger.warning("LLM cache lookup failed for '%s': %s", site, e)
+        response = None
+    if response is not None:
+        tracing.count("cache_hits")
+        return response
+    
+    response = invoke_llm(runnable, prompt)
+    if response is not None:
+        try:
+            llm_cache.update(site, key_prompt, response, semantic_text=semantic_text)
+        except Exception as e:
+            logger.warning("Could not cache the '%s' response: %s", site, e)
+    return response
+
+async def acached_invoke(site: str, runnable, prompt: str, cache_key: str = "", semantic_text: str | None = None):
+    """Async version of `cached_invoke`. Cache access runs in a worker thread since the semantic tier embeds locally."""
+    if site not in LLM_CACHE_SITES:
+        return await ainvoke_llm(runnable, prompt)
+    
+    key_prompt, semantic_text = cache_keys(site, prompt, cache_key, semantic_text)
+    try:
+        response = await asyncio.to_thread(llm_cache.lookup, site, key_prompt, semantic_text)
+    except Exception as e:
+        logger.warning("LLM cache lookup failed for '%s': %s", site, e)
+        response = None
+    if response is not None:
+        tracing.count("cache_hits")
+        return response
+    
+    response = await ainvoke_llm(runnable, prompt)
+    if response is not None:
+        try:
+            await asyncio.to_thread(llm_cache.update, site, key_prompt, response, semantic_text)
+        except Exception as e:
+            logger.warning("Could not cache the '%s' response: %s", site, e)
+    return response
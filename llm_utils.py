@@ -1,22 +1,144 @@
-from config import llm
+import logging
+import queue
+import re
+import threading
+import time
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel, Field
+from config import get_llm, LLM_CACHE_SITES, TITLE_BATCH_SIZE, TITLE_BATCH_WAIT_SECONDS
+from llm_cache import llm_cache, cache_keys, invoke_llm
 
-def generate_conversation_title(query: str) -> str:
-    """
-    Uses an LLM to generate a short, descriptive title for a conversation.
-    """
-    prompt = (
+logger = logging.getLogger(__name__)
+
+# Words left out of heuristic titles
+TITLE_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "in", "on", "for", "to", "with", "about", "is", "are", "was",
+    "what", "how", "why", "when", "who", "which", "can", "could", "do", "does", "me", "i", "you",
+    "please", "tell", "explain", "give", "some", "any", "there"
+}
+
+def heuristic_title(query: str, max_words: int = 5) -> str:
+    """Builds a title from the first content words of the query, shown until the LLM title is ready."""
+    words = re.findall(r"[\w'-]+", query)
+    content = [word for word in words if word.lower() not in TITLE_STOPWORDS] or words
+    title = " ".join(content[:max_words])[:60]
+    return title[:1].upper() + title[1:] if title else "New Chat"
+
+def build_title_prompt(query: str) -> str:
+    """The single-query title prompt, used as the cache key of a conversation's title."""
+    return (
         "You are an expert at summarizing conversations. Your task is to create a concise, "
         "descriptive title (3-4 words maximum) for a new chat session based on the user's first query. "
         "The title should capture the main topic of the query.\n\n"
         f"User's first query: \"{query}\"\n\n"
         "Return ONLY the title itself, with no extra text or quotation marks."
     )
-    
-    try:
-        response = llm.invoke(prompt)
+
+def build_titles_prompt(queries: list[str]) -> str:
+    numbered = "\n".join(f"{i}. \"{query}\"" for i, query in enumerate(queries, 1))
+    return (
+        "You are an expert at summarizing conversations. Your task is to create a concise, "
+        "descriptive title (3-4 words maximum) for each of the following new chat sessions, "
+        "based on the user's first query. Each title should capture the main topic of its query.\n\n"
+        f"First queries:\n{numbered}\n\n"
+        "Return exactly one title per query, in the same order, with no quotation marks."
+    )
+
+
+class ConversationTitles(BaseModel):
+    """Titles of a batch of conversations"""
+    titles: list[str] = Field(description="One title per query, in the order of the queries")
+
+
+def generate_conversation_titles(queries: list[str]) -> list[str | None]:
+    """
+    Uses one LLM call to generate a short, descriptive title for each conversation's first query.
+    Titles already in the response cache are reused. A query gets None if no title came back for it.
+    """
+    cache_enabled = "title" in LLM_CACHE_SITES
+    titles = [None] * len(queries)
+    keys = [cache_keys("title", build_title_prompt(query), "", query) for query in queries]
+    if cache_enabled:
+        for i, (key_prompt, semantic_text) in enumerate(keys):
+            try:
+                cached = llm_cache.lookup("title", key_prompt, semantic_text=semantic_text)
+            except Exception as e:
+                logger.warning("LLM cache lookup failed for 'title': %s", e)
+                cached = None
+            titles[i] = cached.content if cached is not None else None
+
+    missing = [i for i, title in enumerate(titles) if title is None]
+    if not missing:
+        return titles
+
+    response = invoke_llm(get_llm().with_structured_output(ConversationTitles), build_titles_prompt([queries[i] for i in missing]))
+    generated = response.titles if isinstance(response, ConversationTitles) else []
+    if len(generated) != len(missing):
+        logger.warning("Got %d titles for %d conversations, keeping their current titles.", len(generated), len(missing))
+        return titles
+
+    for i, title in zip(missing, generated):
         # Clean up the response to remove potential quotes or extra whitespace
-        title = response.content.strip().strip('"')
-        return title if title else "New Chat"
-    except Exception as e:
-        return "New Chat"
+        title = title.strip().strip('"')
+        if not title:
+            continue
+        titles[i] = title
+        if cache_enabled:
+            key_prompt, semantic_text = keys[i]
+            try:
+                llm_cache.update("title", key_prompt, AIMessage(content=title), semantic_text=semantic_text)
+            except Exception as e:
+                logger.warning("Could not cache the 'title' response: %s", e)
+    return titles
+
+
+class TitleBatcher:
+    """
+    Titles conversations off the request path. Submitted queries are collected on a background
+    thread for up to `max_wait` seconds (or until `max_batch_size` are waiting) and titled in one
+    LLM call. `on_title(key, title)` is called for every generated title. On failure nothing is
+    called, so conversations keep their current title.
+    """
+
+    def __init__(self, on_title, max_batch_size: int = TITLE_BATCH_SIZE, max_wait: float = TITLE_BATCH_WAIT_SECONDS):
+        self.on_title = on_title
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, key, query: str):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="title-batcher", daemon=True)
+                self._thread.start()
+        self._queue.put((key, query))
+
+    def _collect(self) -> list[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
 
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                titles = generate_conversation_titles([query for _, query in batch])
+            except Exception as e:
+                logger.warning("Titling %d conversations failed, keeping their current titles: %s", len(batch), e)
+                continue
+            for (key, _), title in zip(batch, titles):
+                if title:
+                    try:
+                        self.on_title(key, title)
+                    except Exception as e:
+                        logger.warning("Could not save the title of %s: %s", key, e)
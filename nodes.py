@@ -1,24 +1,50 @@
 import arxiv
+import logging
+import sqlite3
+from collections import Counter
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_core.messages import SystemMessage, AIMessage, BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.types import Send
 
 # Import from our local project files
-from state import ResearchState, SourceGrade
-from config import llm, search_tool, embedding_function
-from rag_setup import get_retriever
+from state import ResearchState
+from config import get_llm, get_search_tool, get_arxiv_client, CONTEXT_TOKEN_BUDGET, CONTEXT_HISTORY_SHARE, ROUTING_POLICY
+from rag_setup import retriever_provider
+from grading import grade_documents
+from search_cache import cached_search
+from llm_cache import cached_invoke, invoke_llm
+from document_store import store_documents, load_documents
+from history import render_history, summary_update
+from context_budget import dedupe_and_rank, fit_documents, trim_history
+from routing_policy import plan_tools, has_enough_documents, record_yield
+import tracing
 
-# Initialize the retriever when this module is loaded
-retriever = get_retriever(embedding_function)
+logger = logging.getLogger(__name__)
 
 # Initialize the max number of refinements the strategist can use
 MAX_REFINEMENTS = 2
 
+# The search tools, in the order the sequential graph runs them under the fixed routing policy
+SEARCH_TOOLS = ["web", "arxiv", "rag"]
+
+def planned_tools(state: ResearchState) -> list[str]:
+    """The tools to search for the current question, in order, under the routing policy."""
+    if ROUTING_POLICY == "adaptive":
+        return plan_tools(state['messages'][-1].content)
+    return SEARCH_TOOLS
+
+def start_tool(state: ResearchState) -> str:
+    """The tool to refine the query for: the first planned tool for a new question, else the active tool."""
+    if not state.get('tried_tools'):
+        return planned_tools(state)[0]
+    return state.get('active_tool', 'web')
+
 # Helper function to create query variations
-def refine_query_node(state: ResearchState) -> ResearchState:
+def build_refine_prompt(state: ResearchState, active_tool: str) -> str:
     """
-    Uses an LLM to refine the query based on the conversation history and the failing tool.
+    Builds the prompt asking the LLM to refine the query for `active_tool` based on the conversation history.
     """
-
-    active_tool = state.get('active_tool', 'web')
     
     # This new prompt instructs the LLM on how to handle different query types.
     prompt = (
@@ -39,16 +65,55 @@ def refine_query_node(state: ResearchState) -> ResearchState:
         "    * `arxiv_search`: Should be formal and academic. Use precise technical terms.\n"
         "    * `rag_search`: Should use terminology very specific to the likely content of the local database (e.g., machine learning paper abstracts).\n\n"
         "--- CONVERSATION HISTORY ---\n"
-        f"{state['messages']}\n\n"
+        f"{render_history(state)}\n\n"
         "Final, optimized query string:"
     )
     
-    new_query = llm.invoke(prompt)
+    return prompt
+
+def refine_cache_key(state: ResearchState, active_tool: str) -> str:
+    """Every refinement attempt gets its own cache entry, a retry must not get the query that just failed."""
+    return f"{active_tool}:{state.get(f'refinements_{active_tool}_used', 0)}"
+
+def refine_query(state: ResearchState, active_tool: str) -> str:
+    """
+    Uses an LLM to refine the query for `active_tool` based on the conversation history.
+    """
+    
+    tracing.count("refinements")
+    prompt = build_refine_prompt(state, active_tool)
+    new_query = cached_invoke("refine", get_llm(), prompt, cache_key=refine_cache_key(state, active_tool))
+    
+    return new_query.content
+
+def refinement_update(state: ResearchState, queries: dict[str, str]) -> ResearchState:
+    """Builds the state update of the parallel refinement: the new queries and the bumped counters."""
     
+    update = {
+        "tool_queries": queries,
+        "pending_tools": list(queries)
+    }
+    for tool in queries:
+        refinement_key = f"refinements_{tool}_used"
+        update[refinement_key] = state.get(refinement_key, 0) + 1
+    
+    return update
+
+def refine_query_node(state: ResearchState) -> ResearchState:
+    """
+    Refines the query based on the conversation history and the failing tool.
+    """
+
+    active_tool = start_tool(state)
     refinement_key = f"refinements_{active_tool}_used"
     
+    # Fold the turns that left the verbatim window into the rolling summary, persisted in the state
+    history_update = summary_update(state)
+    
     return {
-        'refined_query': new_query.content,
+        **history_update,
+        'refined_query': refine_query({**state, **history_update}, active_tool),
+        'active_tool': active_tool,
         refinement_key: state.get(refinement_key, 0) + 1
     }
 
@@ -62,11 +127,15 @@ def route_after_refine(state: ResearchState):
     return state['active_tool']
 
 
-def web_search_node(state: ResearchState) -> ResearchState:
-    """Performs a web search."""
+def fetch_web_results(query: str) -> list[str]:
+    """Performs a live web search and returns the content of every result."""
     
-    results = search_tool.invoke({"query": state['refined_query']})
+    return parse_web_results(get_search_tool().invoke({"query": query}))
+
+def parse_web_results(results) -> list[str]:
+    """Extracts the documents from the output of the web search tool."""
     
+    docs = []
     if isinstance(results, str):
         # If results is a string, treat it as a single document or handle as an error
         docs = [results] if results.strip() else []
@@ -74,60 +143,153 @@ def web_search_node(state: ResearchState) -> ResearchState:
         # If results is a list, extract 'content' from each dictionary
         docs = [res['content'] for res in results if res and isinstance(res, dict) and 'content' in res]
 
-    return {
-        "sources": docs, 
-        "active_tool": "web"
-    }
+    return docs
 
-def arxiv_search_node(state: ResearchState) -> ResearchState:
-    """Performs an ArXiv search."""
+def fetch_arxiv_results(query: str) -> list[str]:
+    """Performs a live ArXiv search and returns the paper summaries."""
     
     search = arxiv.Search(
-        query=state['refined_query'],
+        query=query,
         max_results=3,
         sort_by=arxiv.SortCriterion.Relevance
     )
-    summaries = [result.summary.replace("\n", " ") for result in search.results()]
+    return [result.summary.replace("\n", " ") for result in get_arxiv_client().results(search)]
+
+def search_web(query: str) -> list[str]:
+    """Performs a web search, served from the search cache when possible."""
+    return cached_search("web", query, fetch_web_results)
+
+def search_arxiv(query: str) -> list[str]:
+    """Performs an ArXiv search, served from the search cache when possible."""
+    return cached_search("arxiv", query, fetch_arxiv_results)
+
+def search_rag(query: str) -> list[str]:
+    """Performs a RAG search and returns the retrieved abstracts."""
+    
+    tracing.count("tool_calls")
+    retrieved_docs = retriever_provider.get().invoke(query) or []
     
+    return [doc.page_content for doc in retrieved_docs]
+
+SEARCH_FUNCTIONS = {
+    "web": search_web,
+    "arxiv": search_arxiv,
+    "rag": search_rag
+}
+
+
+def rag_is_ready() -> bool:
+    """Whether the retriever finished warming up. Starts the warm-up if it didn't run yet, or retries a failed one."""
+    if retriever_provider.get_if_ready() is not None:
+        return True
+    if retriever_provider.failed():
+        logger.warning("The retriever failed to load (%s), skipping the knowledge base search.", retriever_provider.error)
+    else:
+        logger.info("The retriever is still warming up, skipping the knowledge base search.")
+    return False
+
+def skip_rag_update() -> ResearchState:
+    """
+    State update of a skipped RAG search: no sources, and no refinements left
+    so that the routing moves on instead of refining a query that can't be searched.
+    """
     return {
-        "sources": summaries, 
+        "sources": {"rag": []},
+        "refinements_rag_used": MAX_REFINEMENTS
+    }
+
+
+def web_search_node(state: ResearchState) -> ResearchState:
+    """Performs a web search."""
+    
+    return {
+        "sources": {"web": search_web(state['refined_query'])}, 
+        "active_tool": "web"
+    }
+
+def arxiv_search_node(state: ResearchState) -> ResearchState:
+    """Performs an ArXiv search."""
+    
+    return {
+        "sources": {"arxiv": search_arxiv(state['refined_query'])}, 
         "active_tool": "arxiv"
     }
 
 def rag_search_node(state: ResearchState) -> ResearchState:
     """Performs a RAG search."""
     
-    retrieved_docs = retriever.invoke(state['refined_query']) or []
+    if not rag_is_ready():
+        return {**skip_rag_update(), "active_tool": "rag"}
     
     return {
-        "sources": [doc.page_content for doc in retrieved_docs],
+        "sources": {"rag": search_rag(state['refined_query'])},
         "active_tool": "rag"
     }
 
+def parallel_search_node(state: ResearchState) -> ResearchState:
+    """
+    Runs one branch of the parallel fan-out. The tool comes from the `Send` payload,
+    and only `sources` is written so that the branches can run in the same step.
+    """
+    
+    tool = state['active_tool']
+    query = state.get('tool_queries', {}).get(tool) or state['refined_query']
+    
+    if tool == "rag" and not rag_is_ready():
+        return skip_rag_update()
+    
+    return {
+        "sources": {tool: SEARCH_FUNCTIONS[tool](query)}
+    }
+
 
 def grade_and_filter_node(state: ResearchState) -> ResearchState:
     """Grades a list of documents and returns only the relevant ones."""
     
     query = state['messages'][-1].content
-    documents = state['sources']
+    origins, documents = flatten_sources(state)
     
-    grader = llm.with_structured_output(SourceGrade)
+    # Grade the whole round concurrently, failed or timed-out grades fall back to the default verdict
+    grades = grade_documents(documents, query)
+    
+    return grading_update(state, origins, documents, grades)
+
+def flatten_sources(state: ResearchState) -> tuple[list[str], list[str]]:
+    """
+    Flattens the sources of every tool that searched in the last step.
+    Returns the tool each document came from and the documents themselves.
+    """
+    sources = state.get('sources') or {}
+    origins = [tool for tool, docs in sources.items() for _ in docs]
+    documents = [doc for docs in sources.values() for doc in docs]
+    return origins, documents
+
+def grading_update(state: ResearchState, origins: list[str], documents: list[str], grades: list) -> ResearchState:
+    """Builds the state update of a grading round from the grade of every document."""
     
     relevant_docs = []
-    for doc in documents:
-        prompt = f"Is the following document relevant to the user's question? Document:\n\n{doc}\n\nQuestion: {query}"
-        response = grader.invoke(prompt)
-        if response.related:
+    newly_added_by_tool = {tool: 0 for tool in (state.get('sources') or {})}
+    for tool, doc, grade in zip(origins, documents, grades):
+        if grade.related:
             relevant_docs.append(doc)
-       
-    # Append relevant docs to the main list
+            newly_added_by_tool[tool] += 1
+
+    # Store the relevant docs once and append their hashes to the main list
     current_related_docs = state.get('related_documents', [])
-    updated_related_docs = current_related_docs + relevant_docs
+    updated_related_docs = list(dict.fromkeys(current_related_docs + store_documents(relevant_docs)))
+    
+    # Feed the per-tool yield statistics of the adaptive routing policy
+    try:
+        record_yield(state['messages'][-1].content, Counter(origins), newly_added_by_tool)
+    except sqlite3.Error as e:
+        logger.warning("Could not record the tool yield: %s", e)
 
     return {
         "related_documents": updated_related_docs,
         "newly_added_count": len(relevant_docs),
-        "sources": [] # Clear the temporary sources list
+        "newly_added_by_tool": newly_added_by_tool,
+        "tried_tools": list(dict.fromkeys(state.get('tried_tools', []) + list(newly_added_by_tool))),
+        "sources": {} # Clear the temporary sources
     }
 
 def route_after_grading(state: ResearchState):
@@ -139,56 +301,148 @@ def route_after_grading(state: ResearchState):
     last_added_count = state.get("newly_added_count", 0)
     active_tool = state["active_tool"]
     
-    if last_added_count > 0:
-        # If docs were found, advance to the next tool in the sequence
-        if active_tool == "web":
-            return "arxiv"
-        elif active_tool == "arxiv":
-            return "rag"
-        else: # After rag, we are done with searching
-            return "synthesize"
-    else:
-        # If no docs were found, check if we can refine
+    # Adaptive policy: stop searching as soon as enough relevant documents have accumulated
+    if ROUTING_POLICY == "adaptive" and has_enough_documents(state):
+        return "synthesize"
+    
+    if last_added_count == 0:
+        # If no docs were found, check if we can refine. The adaptive policy searches the other
+        # planned tools first, a fresh search yields more than a refinement of the failing one
         refinement_key = f"refinements_{active_tool}_used"
         if state.get(refinement_key, 0) < MAX_REFINEMENTS:
-            return "need_refine"
-        else:
-            # If out of refinements for this tool, advance anyway to avoid getting stuck
-            if active_tool == "web":
-                return "arxiv"
-            elif active_tool == "arxiv":
-                return "rag"
-            else:
-                return "synthesize"
+            if ROUTING_POLICY != "adaptive" or next_tool(state) == "synthesize":
+                return "need_refine"
+    
+    # Docs were found, or the tool is out of refinements: advance to the next tool to avoid getting stuck
+    return next_tool(state)
+
+def next_tool(state: ResearchState) -> str:
+    """The next planned tool not searched yet for this question, or 'synthesize' once all of them ran."""
+    tried = set(state.get('tried_tools', [])) | {state['active_tool']}
+    for tool in planned_tools(state):
+        if tool not in tried:
+            return tool
+    return "synthesize"
+
+
+def tools_to_refine(state: ResearchState) -> list[str]:
+    """Returns the tools of the last parallel round that found nothing and can still be refined."""
+    return [
+        tool for tool, count in state.get("newly_added_by_tool", {}).items()
+        if count == 0 and state.get(f"refinements_{tool}_used", 0) < MAX_REFINEMENTS
+    ]
+
+def route_after_parallel_grading(state: ResearchState):
+    """
+    Routes logic after the 'grade_and_filter' node in the parallel graph.
+    Only the tools that came back empty are refined, otherwise we are done searching.
+    """
+    if ROUTING_POLICY == "adaptive" and has_enough_documents(state):
+        return "synthesize"
+    if tools_to_refine(state):
+        return "need_refine"
+    return "synthesize"
+
+def refine_tools_node(state: ResearchState) -> ResearchState:
+    """
+    Refines the query separately for every tool of the parallel fan-out that came back empty.
+    """
     
+    tools = tools_to_refine(state)
+    with ContextThreadPoolExecutor(max_workers=len(tools)) as executor:
+        queries = list(executor.map(lambda tool: refine_query(state, tool), tools))
     
-def synthesizer_node(state: ResearchState) -> ResearchState:
-    """The final node that synthesizes the answer."""
+    return refinement_update(state, dict(zip(tools, queries)))
+
+def fan_out_search(state: ResearchState):
+    """
+    Sends the query to every pending tool (all planned tools on the first round),
+    so that their searches run in a single step.
+    """
+    tools = state.get('pending_tools') or planned_tools(state)
+    return [Send(f"{tool}_search", {**state, "active_tool": tool}) for tool in tools]
+    
+    
+def budget_context_node(state: ResearchState) -> ResearchState:
+    """
+    Fits the synthesis prompt into the context budget: near-duplicate documents are dropped,
+    the rest are ranked against the question and cut to the documents' share of the budget,
+    and the conversation history gets the remaining share.
+    """
     
-    docs = "\n\n---\n\n".join(state.get('related_documents', []))
+    question = state['messages'][-1].content
+    documents = load_documents(state.get('related_documents', []))
+    history_tokens = count_tokens_approximately(state['messages'])
+    
+    # The history gets its share of the budget, the documents get the rest (and whatever the history leaves unused)
+    history_budget = min(history_tokens, int(CONTEXT_TOKEN_BUDGET * CONTEXT_HISTORY_SHARE))
+    kept_docs = fit_documents(dedupe_and_rank(documents, question), CONTEXT_TOKEN_BUDGET - history_budget)
+    
+    # Measure what the synthesizer will actually receive: the trimmed history and the system prompt
+    kept_history = trim_history(list(state['messages']), history_budget) if history_budget else list(state['messages'])
+    kept_history_tokens = count_tokens_approximately(kept_history)
+    system_prompt_tokens = count_tokens_approximately([SystemMessage(content=build_synthesis_prompt(kept_docs))])
+    logger.info(
+        "Context budget: %d -> %d tokens (documents %d -> %d, history %d -> %d tokens)",
+        history_tokens + count_tokens_approximately([SystemMessage(content=build_synthesis_prompt(documents))]),
+        kept_history_tokens + system_prompt_tokens,
+        len(documents), len(kept_docs),
+        history_tokens, kept_history_tokens
+    )
+    
+    return {
+        "related_documents": store_documents(kept_docs),
+        "history_token_budget": history_budget
+    }
+
+def build_synthesis_prompt(documents: list[str]) -> str:
+    """The system prompt of the synthesizer, carrying the documents."""
+    docs = "\n\n---\n\n".join(documents)
+    return (
+        "Based ONLY on the following documents, provide a comprehensive and well-structured answer to the last user query. "
+        "Do not mention the documents themselves in your answer. Synthesize the information into a single, coherent response.\n\n"
+        f"Documents:\n{docs}"
+    )
+
+def build_synthesis_messages(state: ResearchState) -> tuple[list[BaseMessage], bool]:
+    """
+    Builds the messages sent to the synthesizer.
+    Returns them and whether there were documents to synthesize from. Without documents,
+    the messages end with the final "nothing found" answer and no LLM call is needed.
+    """
+    
+    documents = load_documents(state.get('related_documents', []))
     
     synthesizer_messages: list[BaseMessage] = list(state["messages"])
     
-    if not docs:
+    if not documents:
         no_docs_message = "After a thorough search, I could not find any relevant documents to answer your question."
         
         synthesizer_messages.append(AIMessage(content=no_docs_message))
         
+        return synthesizer_messages, False
+    
+    # Keep only the recent turns that fit in the history budget set by budget_context_node
+    history_budget = state.get('history_token_budget')
+    if history_budget:
+        synthesizer_messages = trim_history(synthesizer_messages, history_budget)
+
+    synthesizer_messages.append(SystemMessage(content=build_synthesis_prompt(documents)))
+    
+    return synthesizer_messages, True
+
+def synthesizer_node(state: ResearchState) -> ResearchState:
+    """The final node that synthesizes the answer."""
+    
+    synthesizer_messages, has_docs = build_synthesis_messages(state)
+    if not has_docs:
         return {
             "messages": synthesizer_messages
         }
 
-    prompt = (
-        "Based ONLY on the following documents, provide a comprehensive and well-structured answer to the last user query. "
-        "Do not mention the documents themselves in your answer. Synthesize the information into a single, coherent response.\n\n"
-        f"Documents:\n{docs}"
-    )
-    
-    synthesizer_messages.append(SystemMessage(content=prompt))
-
-    response = llm.invoke(synthesizer_messages)
+    # When the graph runs with stream_mode="messages", LangGraph streams the tokens of this call
+    response = invoke_llm(get_llm(), synthesizer_messages)
     
     return {
         "messages": response
     }
-    
\ No newline at end of file
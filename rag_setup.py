@@ -1,25 +1,80 @@
 import os
-from langchain_core.documents import Document
-from datasets import load_dataset
-from langchain_chroma import Chroma
-
-CHROMA_PATH = "chroma_db"
-
-def get_retriever(embedding_function):
-    """Creates or loads the ChromaDB and returns a retriever."""
-    if not os.path.exists(CHROMA_PATH):
-        dataset = load_dataset("CShorten/ML-ArXiv-Papers", split="train")
-        docs = [
-            Document(
-                page_content=row["abstract"],
-                metadata={"title": row["title"]}
-            ) for row in dataset.select(range(80000))
-        ]
-        db = Chroma.from_documents(docs, embedding_function, persist_directory=CHROMA_PATH)
-    else:
-        db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+
+# Import from our local project files
+from config import (
+    RAG_CORPUS_SIZE,
+    RETRIEVER_BACKEND,
+    RETRIEVER_K,
+    RETRIEVER_SCORE_THRESHOLD,
+    RETRIEVER_HYBRID,
+    RETRIEVER_RERANKER,
+    HYBRID_CANDIDATES,
+    BackgroundProvider,
+    get_embedding_function
+)
+
+# Rows read from the Chroma store per step by the index builders
+STORE_BATCH_SIZE = 5000
+
+def iter_collection(collection, include: list[str], batch_size: int = STORE_BATCH_SIZE):
+    """Yields the whole Chroma collection in batches, each as returned by `collection.get` with `include`."""
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        yield collection.get(include=include, limit=batch_size, offset=offset)
+
+def get_chroma_store(embedding_function):
+    """Creates or loads the ChromaDB, building or topping it up from the arXiv corpus."""
+    # Imported here, loading Chroma and the dataset libraries is slow
+    from langchain_chroma import Chroma
+    from ingest import CHROMA_PATH, ingest_arxiv_corpus, is_ingested
     
+    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+    
+    # Build the store on first start, or top it up when the corpus size was raised. The manifest
+    # decides, the store holds fewer documents than rows read since duplicate papers are merged
+    if not is_ingested(RAG_CORPUS_SIZE):
+        ingest_arxiv_corpus(RAG_CORPUS_SIZE)
+    
+    return db
+
+def create_chroma_retriever(embedding_function, k: int = RETRIEVER_K):
+    """Exact similarity search in the Chroma store."""
+    db = get_chroma_store(embedding_function)
     return db.as_retriever(
                 search_type="similarity_score_threshold",
-                search_kwargs={"k": 3, "score_threshold": 0.5}
-            )
\ No newline at end of file
+                search_kwargs={"k": k, "score_threshold": RETRIEVER_SCORE_THRESHOLD}
+            )
+
+def create_faiss_retriever(embedding_function, k: int = RETRIEVER_K):
+    """Approximate nearest-neighbour search in a FAISS index built from the Chroma store's vectors."""
+    from vector_index import INDEX_FILE, FaissRetriever, build_ann_index, load_ann_index, set_search_params
+    
+    if not os.path.exists(INDEX_FILE):
+        build_ann_index(get_chroma_store(embedding_function)._collection)
+    
+    index = load_ann_index()
+    set_search_params(index)
+    return FaissRetriever(index=index, embeddings=embedding_function, k=k)
+
+# Every backend builds a LangChain retriever, which is all the RAG nodes rely on
+RETRIEVER_BACKENDS = {
+    "chroma": create_chroma_retriever,
+    "faiss": create_faiss_retriever
+}
+
+def get_retriever(embedding_function, backend: str = RETRIEVER_BACKEND, hybrid: bool = RETRIEVER_HYBRID):
+    """
+    Creates the retriever of the configured backend. In hybrid mode, the backend provides the dense
+    candidates, which are fused with keyword search results (see hybrid_retrieval.py).
+    """
+    if backend not in RETRIEVER_BACKENDS:
+        raise ValueError(f"Unknown retriever backend '{backend}', expected one of {list(RETRIEVER_BACKENDS)}")
+    if not hybrid:
+        return RETRIEVER_BACKENDS[backend](embedding_function)
+    
+    from hybrid_retrieval import create_hybrid_retriever
+    dense = RETRIEVER_BACKENDS[backend](embedding_function, k=HYBRID_CANDIDATES)
+    return create_hybrid_retriever(dense, get_chroma_store(embedding_function)._collection, RETRIEVER_RERANKER)
+
+# The retriever is built on a background thread (see app.py), the RAG search is skipped until it is ready
+retriever_provider = BackgroundProvider(lambda: get_retriever(get_embedding_function()))
@@ -0,0 +1,95 @@
+import logging
+import re
+import sqlite3
+
+# Import from our local project files
+from config import (
+    ROUTING_ENOUGH_DOCUMENTS, ROUTING_MIN_PRECISION, ROUTING_MIN_SAMPLES,
+    ROUTING_PRIOR_PRECISION, ROUTING_PRIOR_DOCUMENTS
+)
+from db_utils import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Time-sensitive questions go to the web first, questions about papers to ArXiv and the
+# knowledge base, and everything else ("what is X?") to the web and then the knowledge base
+CURRENT_PATTERN = re.compile(r"\b(latest|recent(ly)?|news|today|current(ly)?|announced|released|this (week|month|year)|20\d\d)\b", re.IGNORECASE)
+RESEARCH_PATTERN = re.compile(r"\b(papers?|arxiv|survey|literature|state[- ]of[- ]the[- ]art|sota|publications?|studies|benchmarks?)\b", re.IGNORECASE)
+
+TOOL_ORDER_BY_QUERY_TYPE = {
+    "current": ["web", "arxiv", "rag"],
+    "research": ["arxiv", "rag", "web"],
+    "factual": ["web", "rag", "arxiv"]
+}
+
+def classify_query(question: str) -> str:
+    """Classifies a question as 'current', 'research' or 'factual' with keyword rules."""
+    if CURRENT_PATTERN.search(question):
+        return "current"
+    if RESEARCH_PATTERN.search(question):
+        return "research"
+    return "factual"
+
+def tool_precision(query_type: str) -> dict[str, tuple[int, float]]:
+    """
+    Returns the graded searches and the share of relevant documents of every tool for `query_type`.
+    The share is smoothed towards ROUTING_PRIOR_PRECISION, so a few searches can't swing it far.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            "SELECT tool, searches, documents, relevant FROM tool_yield WHERE query_type = ?",
+            (query_type,)
+        )
+        return {
+            tool: (searches, (relevant + ROUTING_PRIOR_PRECISION * ROUTING_PRIOR_DOCUMENTS) / (documents + ROUTING_PRIOR_DOCUMENTS))
+            for tool, searches, documents, relevant in cursor.fetchall()
+        }
+
+def plan_tools(question: str) -> list[str]:
+    """
+    Returns the tools to search for `question`, best first. Tools are ordered by their smoothed
+    precision for the question's type, ties (e.g. no statistics yet) keep the order of the query
+    type. A tool with ROUTING_MIN_SAMPLES graded searches and a precision below
+    ROUTING_MIN_PRECISION is skipped. The best tool is always kept.
+    """
+    query_type = classify_query(question)
+    order = TOOL_ORDER_BY_QUERY_TYPE[query_type]
+    try:
+        stats = tool_precision(query_type)
+    except sqlite3.Error as e:
+        logger.warning("Could not read the tool yield statistics: %s", e)
+        return list(order)
+
+    precision = {tool: stats[tool][1] if tool in stats else ROUTING_PRIOR_PRECISION for tool in order}
+    order = sorted(order, key=lambda tool: -precision[tool])
+
+    kept = [
+        tool for tool in order
+        if tool not in stats or stats[tool][0] < ROUTING_MIN_SAMPLES or precision[tool] >= ROUTING_MIN_PRECISION
+    ]
+    return kept or order[:1]
+
+def has_enough_documents(state) -> bool:
+    """Whether enough relevant documents have accumulated to stop searching."""
+    return len(state.get("related_documents", [])) >= ROUTING_ENOUGH_DOCUMENTS
+
+def record_yield(question: str, documents_by_tool: dict[str, int], relevant_by_tool: dict[str, int]):
+    """
+    Adds a grading round to the yield statistics of the question's type. Tools that returned
+    nothing are not counted, their search didn't run (e.g. the knowledge base was warming up) or failed.
+    """
+    query_type = classify_query(question)
+    rows = [
+        (query_type, tool, documents, relevant_by_tool.get(tool, 0))
+        for tool, documents in documents_by_tool.items() if documents
+    ]
+    if not rows:
+        return
+    with get_db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO tool_yield (query_type, tool, searches, documents, relevant) VALUES (?, ?, 1, ?, ?) "
+            "ON CONFLICT(query_type, tool) DO UPDATE SET searches = searches + 1, "
+            "documents = documents + excluded.documents, relevant = relevant + excluded.relevant",
+            rows
+        )
+        conn.commit()
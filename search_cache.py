@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Awaitable, Callable
+
+# Import from our local project files
+from config import SEARCH_CACHE_TTL_SECONDS, SEARCH_CACHE_MAX_ENTRIES
+from db_utils import get_db_connection
+import tracing
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """Normalizes a query so that trivially different spellings share a cache entry."""
+    return " ".join(query.lower().split())
+
+def get_cached_results(tool: str, query: str) -> list[str] | None:
+    """
+    Returns the cached results of `tool` for `query`, or None if there is no fresh entry.
+    Every lookup is counted as a hit or a miss.
+    """
+    key = normalize_query(query)
+    now = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT results, created_at FROM search_cache WHERE tool = ? AND query = ?",
+            (tool, key)
+        )
+        row = cursor.fetchone()
+        
+        results = None
+        if row and now - row[1] <= SEARCH_CACHE_TTL_SECONDS.get(tool, 0):
+            results = json.loads(row[0])
+            cursor.execute(
+                "UPDATE search_cache SET last_used_at = ? WHERE tool = ? AND query = ?",
+                (now, tool, key)
+            )
+        elif row:
+            # Expired entry, drop it
+            cursor.execute("DELETE FROM search_cache WHERE tool = ? AND query = ?", (tool, key))
+        
+        counter = "hits" if results is not None else "misses"
+        cursor.execute(
+            f"INSERT INTO search_cache_stats (tool, {counter}) VALUES (?, 1) "
+            f"ON CONFLICT(tool) DO UPDATE SET {counter} = {counter} + 1",
+            (tool,)
+        )
+        conn.commit()
+    return results
+
+def store_results(tool: str, query: str, results: list[str]):
+    """Stores the results of a live search, evicting the least recently used entries beyond the size limit."""
+    now = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO search_cache (tool, query, results, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+            (tool, normalize_query(query), json.dumps(results), now, now)
+        )
+        cursor.execute(
+            "DELETE FROM search_cache WHERE rowid IN "
+            "(SELECT rowid FROM search_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (SEARCH_CACHE_MAX_ENTRIES,)
+        )
+        conn.commit()
+
+def cached_search(tool: str, query: str, search: Callable[[str], list[str]]) -> list[str]:
+    """
+    Returns the results of `search(query)` through the cache. Empty results are not cached,
+    so a failed search is retried live next time. Cache errors never fail the search itself.
+    """
+    try:
+        results = get_cached_results(tool, query)
+    except sqlite3.Error as e:
+        logger.warning("Search cache lookup failed for %s: %s", tool, e)
+        results = None
+    if results is not None:
+        tracing.count("cache_hits")
+        return results
+    
+    tracing.count("tool_calls")
+    results = search(query)
+    if results:
+        try:
+            store_results(tool, query, results)
+        except sqlite3.Error as e:
+            logger.warning("Could not cache %s results: %s", tool, e)
+    return results
+
+async def acached_search(tool: str, query: str, search: Callable[[str], Awaitable[list[str]]]) -> list[str]:
+    """Async version of `cached_search`, for an async `search`. Cache access runs in a worker thread."""
+    try:
+        results = await asyncio.to_thread(get_cached_results, tool, query)
+    except sqlite3.Error as e:
+        logger.warning("Search cache lookup failed for %s: %s", tool, e)
+        results = None
+    if results is not None:
+        tracing.count("cache_hits")
+        return results
+    
+    tracing.count("tool_calls")
+    results = await search(query)
+    if results:
+        try:
+            await asyncio.to_thread(store_results, tool, query, results)
+        except sqlite3.Error as e:
+            logger.warning("Could not cache %s results: %s", tool, e)
+    return results
+
+def get_cache_stats() -> dict[str, dict[str, int]]:
+    """Returns the hit and miss counters of every tool."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT tool, hits, misses FROM search_cache_stats")
+        return {tool: {"hits": hits, "misses": misses} for tool, hits, misses in cursor.fetchall()}
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import threading
+
+# Path of the database, can point elsewhere e.g. for benchmarks on a throwaway database
+DB_FILE = os.getenv("DB_FILE", "db.sqlite")
+
+# How long a connection waits for a lock held by another writer before failing
+BUSY_TIMEOUT_SECONDS = 30
+# Prepared statements kept per connection, reused as long as the connection lives
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    # Readers don't block the writer and the writer doesn't block readers
+    "PRAGMA journal_mode=WAL",
+    # Safe with WAL, and avoids an fsync on every commit
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_SECONDS * 1000}"
+)
+
+
+class ConnectionManager:
+    """
+    The single entry point to the SQLite database, shared by db_utils, the caches and the checkpointer.
+    Every thread gets its own long-lived connection, so connection setup and statement
+    preparation are paid once per thread instead of once per query.
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shared = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens a new, configured connection."""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    def get_shared_connection(self) -> sqlite3.Connection:
+        """
+        Returns the connection shared between threads, for the checkpointer.
+        SqliteSaver serializes access to it with its own lock.
+        """
+        with self._lock:
+            if self._shared is None:
+                self._shared = self.connect()
+            return self._shared
+
+    async def aconnect(self) -> "aiosqlite.Connection":
+        """Opens a new, configured async connection, for the async checkpointer."""
+        # Imported here, only the async graph needs aiosqlite
+        import aiosqlite
+        conn = await aiosqlite.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+
+connection_manager = ConnectionManager()
@@ -1,21 +1,41 @@
-from typing import TypedDict, List, Annotated, Sequence
+from typing import TypedDict, List, Dict, Annotated, Sequence
 from langgraph.graph.message import add_messages
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
 
+
+def merge_tool_results(left: Dict, right: Dict) -> Dict:
+    """
+    Reducer for values keyed by tool name. Updates written by different tools in the
+    same step are merged together, an empty update clears the whole value.
+    """
+    if not right:
+        return {}
+    if not isinstance(left, dict):
+        left = {}
+    return {**left, **right}
+
+
 class ResearchState(TypedDict):
     """The complete state of the research agent."""
     
     # The full conversation history
     messages: Annotated[Sequence, add_messages]
     
+    # Rolling summary of the turns older than the verbatim window used in refinement prompts,
+    # and how many user/assistant messages it already covers
+    history_summary: str
+    history_summarized_count: int
+    
     # The query used by tools, which can be refined
     refined_query: str
     
-    # Consolidated list of all documents that have passed the grader
+    # Consolidated list of all documents that have passed the grader, as hashes
+    # into the document store so that checkpoints don't repeat their content
     related_documents: List[str]
     
-    # Raw documents from a search node, awaiting grading
-    sources: List[str]
+    # Raw documents from the search nodes keyed by tool, awaiting grading
+    sources: Annotated[Dict[str, List[str]], merge_tool_results]
     
     # Counters for the strategist's status report
     refinements_web_used: int
@@ -24,8 +44,35 @@ class ResearchState(TypedDict):
 
     newly_added_count: int
     
-    # The strategist's decision on the next tool to run
+    # The strategist's decision on the next tool to run, and the tools searched for this question
     active_tool: str
+    tried_tools: List[str]
+    
+    # Parallel mode: per-tool refined queries, relevant documents found per tool
+    # in the last grading round and the tools the next fan-out should search
+    tool_queries: Annotated[Dict[str, str], merge_tool_results]
+    newly_added_by_tool: Dict[str, int]
+    pending_tools: List[str]
+    
+    # Tokens of conversation history the synthesizer may use, set by the context budget stage
+    history_token_budget: int
+
+
+def new_question_state(question: str) -> dict:
+    """Returns the input of a graph run for a new user question, resetting the per-question fields."""
+    return {
+        "messages": [HumanMessage(content=question)],
+        "refined_query": question,
+        "sources": {},
+        "related_documents": [],
+        "refinements_web_used": 0,
+        "refinements_arxiv_used": 0,
+        "refinements_rag_used": 0,
+        "active_tool": "web",
+        "tried_tools": [],
+        "tool_queries": {},
+        "pending_tools": []
+    }
 
 
 class SourceGrade(BaseModel):
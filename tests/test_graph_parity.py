@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("langgraph.checkpoint.sqlite.aio")
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from config import llm_provider, search_tool_provider, arxiv_client_factory_provider, embedding_provider
+from rag_setup import retriever_provider
+from sqlite_pool import connection_manager
+from llm_cache import llm_cache
+import db_utils
+from graph import GRAPH_MODES, create_graph, create_async_graph, astream_research
+from state import new_question_state
+from benchmarks.stubs import ServiceBehaviour, FakeChatModel, FakeSearchTool, FakeArxivClient, FakeRetriever
+
+QUESTIONS = (
+    "What are the main ideas behind graph neural networks?",
+    "Which papers introduced mixture of experts?"
+)
+
+@pytest.fixture
+def fresh_services(tmp_path, monkeypatch):
+    """
+    Returns a function that starts a run from scratch: its own database (and with it its own
+    search cache and document store), an empty LLM response cache and new service stand-ins.
+    It returns the stand-ins' behaviours, whose call counters show which services the run reached.
+    """
+    providers = (llm_provider, search_tool_provider, arxiv_client_factory_provider, retriever_provider, embedding_provider)
+    previous = {provider: provider._instance for provider in providers}
+
+    def start(name: str) -> dict[str, ServiceBehaviour]:
+        monkeypatch.setattr(connection_manager, "path", str(tmp_path / f"{name}.sqlite"))
+        monkeypatch.setattr(connection_manager, "_local", threading.local())
+        monkeypatch.setattr(connection_manager, "_shared", None)
+        llm_cache.clear()
+
+        behaviours = {tool: ServiceBehaviour() for tool in ("llm", "web", "arxiv", "rag")}
+        llm_provider.override(FakeChatModel(behaviour=behaviours["llm"], relevance={"web": 0.3, "arxiv": 0.5, "rag": 0.6}))
+        search_tool_provider.override(FakeSearchTool(behaviours["web"]))
+        arxiv_client_factory_provider.override(lambda: FakeArxivClient(behaviours["arxiv"]))
+        retriever_provider.override(FakeRetriever(behaviour=behaviours["rag"]))
+        embedding_provider.override(DeterministicFakeEmbedding(size=64))
+        db_utils.initialize_db()
+        return behaviours
+
+    yield start
+    llm_cache.clear()
+    for provider, instance in previous.items():
+        provider.override(instance)
+
+def comparable(state: dict) -> dict:
+    """The final state without message ids, which differ between runs."""
+    return {
+        **state,
+        "messages": [(type(message).__name__, message.content) for message in state["messages"]]
+    }
+
+def call_counts(behaviours: dict[str, ServiceBehaviour]) -> dict[str, int]:
+    return {service: behaviour.calls for service, behaviour in behaviours.items()}
+
+def run_sync(mode: str) -> list[dict]:
+    app = create_graph(mode)
+    config = {"configurable": {"thread_id": "parity"}, "recursion_limit": 50}
+    return [comparable(app.invoke(new_question_state(question), config=config)) for question in QUESTIONS]
+
+async def run_async(mode: str) -> list[dict]:
+    app = await create_async_graph(mode)
+    config = {"configurable": {"thread_id": "parity"}, "recursion_limit": 50}
+    try:
+        return [comparable(await app.ainvoke(new_question_state(question), config=config)) for question in QUESTIONS]
+    finally:
+        await app.checkpointer.conn.close()
+
+async def run_streamed(mode: str) -> list[dict]:
+    """Runs the questions through `astream_research` and keeps the last full state of each."""
+    app = await create_async_graph(mode)
+    states = []
+    try:
+        for question in QUESTIONS:
+            final_state = None
+            async for state in astream_research(app, question, "parity", stream_mode="values"):
+                final_state = state
+            states.append(comparable(final_state))
+        return states
+    finally:
+        await app.checkpointer.conn.close()
+
+@pytest.mark.parametrize("mode", GRAPH_MODES)
+def test_sync_and_async_graphs_agree(fresh_services, mode):
+    sync_behaviours = fresh_services(f"sync-{mode}")
+    sync_states = run_sync(mode)
+    async_behaviours = fresh_services(f"async-{mode}")
+    async_states = asyncio.run(run_async(mode))
+
+    # Both runs reached every service, none was answered from the other's caches
+    assert all(call_counts(sync_behaviours).values())
+    assert call_counts(async_behaviours) == call_counts(sync_behaviours)
+    assert [state["messages"][-1] for state in sync_states] == [state["messages"][-1] for state in async_states]
+    assert sync_states == async_states
+
+@pytest.mark.parametrize("mode", GRAPH_MODES)
+def test_streamed_research_matches_invoke(fresh_services, mode):
+    invoke_behaviours = fresh_services(f"invoke-{mode}")
+    invoked_states = asyncio.run(run_async(mode))
+    stream_behaviours = fresh_services(f"stream-{mode}")
+    streamed_states = asyncio.run(run_streamed(mode))
+
+    assert all(call_counts(stream_behaviours).values())
+    assert call_counts(stream_behaviours) == call_counts(invoke_behaviours)
+    assert streamed_states == invoked_states
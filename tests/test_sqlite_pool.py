@@ -0,0 +1,47 @@
+import sqlite3
+import threading
+import pytest
+
+sqlite_checkpoint = pytest.importorskip("langgraph.checkpoint.sqlite")
+from langgraph.checkpoint.base import empty_checkpoint
+
+from sqlite_pool import ConnectionManager
+
+THREADS = 8
+ROWS_PER_THREAD = 200
+
+def test_concurrent_writes_and_checkpoints(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "test.sqlite"))
+    with manager.connect() as conn:
+        conn.execute("CREATE TABLE rows (writer INTEGER, n INTEGER, PRIMARY KEY (writer, n))")
+    saver = sqlite_checkpoint.SqliteSaver(manager.get_shared_connection())
+    saver.setup()
+
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def write(writer: int):
+        try:
+            start.wait()
+            conn = manager.get_connection()
+            for n in range(ROWS_PER_THREAD):
+                conn.execute("INSERT INTO rows (writer, n) VALUES (?, ?)", (writer, n))
+                conn.commit()
+                if n % 20 == 0:
+                    config = {"configurable": {"thread_id": f"thread-{writer}", "checkpoint_ns": ""}}
+                    saver.put(config, empty_checkpoint(), {"step": n}, {})
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with manager.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0] == THREADS * ROWS_PER_THREAD
+    for writer in range(THREADS):
+        config = {"configurable": {"thread_id": f"thread-{writer}"}}
+        assert len(list(saver.list(config))) == ROWS_PER_THREAD // 20
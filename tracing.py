@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Import from our local project files
+from config import TRACING_ENABLED, TRACE_COST_PER_MILLION_TOKENS
+from sqlite_pool import connection_manager
+
+logger = logging.getLogger(__name__)
+
+# Counters of the node invocation running in the current context. Worker threads see them
+# as long as they are started with a copy of the context (asyncio.to_thread, ContextThreadPoolExecutor)
+_current_counters = contextvars.ContextVar("trace_counters", default=None)
+_counters_lock = threading.Lock()
+
+def count(name: str, n: int = 1):
+    """Adds `n` to a counter of the traced node invocation in progress, if any."""
+    counters = _current_counters.get()
+    if counters is not None:
+        with _counters_lock:
+            counters[name] += n
+
+def current_thread_id() -> str:
+    """Returns the thread_id of the graph run calling this, or '' outside of a run."""
+    try:
+        from langgraph.config import get_config
+        return get_config().get("configurable", {}).get("thread_id", "")
+    except RuntimeError:
+        return ""
+
+def current_question(state) -> str:
+    """Returns the latest user message of the state, which identifies the question being answered."""
+    for message in reversed(state.get("messages", [])):
+        if getattr(message, "type", "") == "human":
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+def usage_totals(usage: dict) -> tuple[int, int, float]:
+    """Sums the token usage of every model into (input tokens, output tokens, cost in dollars)."""
+    input_tokens = sum(u.get("input_tokens", 0) for u in usage.values())
+    output_tokens = sum(u.get("output_tokens", 0) for u in usage.values())
+    cost = (
+        input_tokens * TRACE_COST_PER_MILLION_TOKENS["input"]
+        + output_tokens * TRACE_COST_PER_MILLION_TOKENS["output"]
+    ) / 1_000_000
+    return input_tokens, output_tokens, cost
+
+def write_trace(row: tuple):
+    try:
+        with connection_manager.get_connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO node_traces (
+                    thread_id, node, question, started_at, duration_ms, input_tokens, output_tokens,
+                    cost, llm_calls, tool_calls, cache_hits, refinements, error
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                row
+            )
+    except sqlite3.Error as e:
+        logger.warning("Could not write the node trace: %s", e)
+
+def trace_row(node: str, state, started_at: float, duration: float, counters: Counter, usage: dict, error: str | None) -> tuple:
+    input_tokens, output_tokens, cost = usage_totals(usage)
+    return (
+        current_thread_id(), node, current_question(state), started_at, duration * 1000,
+        input_tokens, output_tokens, cost, counters["llm_calls"], counters["tool_calls"],
+        counters["cache_hits"], counters["refinements"], error
+    )
+
+def traced(node: str, fn):
+    """
+    Wraps a graph node so that every invocation writes a row to `node_traces`.
+    Returns `fn` itself when tracing is disabled, so it costs nothing then.
+    """
+    if not TRACING_ENABLED:
+        return fn
+    
+    from langchain_core.callbacks import get_usage_metadata_callback
+    
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state, *args, **kwargs):
+            counters = Counter()
+            token = _current_counters.set(counters)
+            started_at, start, error = time.time(), time.perf_counter(), None
+            try:
+                with get_usage_metadata_callback() as usage:
+                    return await fn(state, *args, **kwargs)
+            except Exception as e:
+                error = repr(e)
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                _current_counters.reset(token)
+                row = trace_row(node, state, started_at, duration, counters, usage.usage_metadata, error)
+                await asyncio.to_thread(write_trace, row)
+        return async_wrapper
+    
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        counters = Counter()
+        token = _current_counters.set(counters)
+        started_at, start, error = time.time(), time.perf_counter(), None
+        try:
+            with get_usage_metadata_callback() as usage:
+                return fn(state, *args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_counters.reset(token)
+            write_trace(trace_row(node, state, started_at, duration, counters, usage.usage_metadata, error))
+    return wrapper
+
+def traced_nodes(nodes: dict) -> dict:
+    """Applies `traced` to every node of a node table."""
+    return {name: traced(name, fn) for name, fn in nodes.items()}
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of `values`, 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def node_report(thread_id: str | None = None) -> list[dict]:
+    """Returns the call count, p50/p95 latency, tokens and cost of every node, slowest p95 first."""
+    query = "SELECT node, duration_ms, input_tokens + output_tokens, cost, error FROM node_traces"
+    params = ()
+    if thread_id:
+        query += " WHERE thread_id = ?"
+        params = (thread_id,)
+    
+    per_node = defaultdict(list)
+    with connection_manager.get_connection() as conn:
+        for node, duration_ms, tokens, cost, error in conn.execute(query, params):
+            per_node[node].append((duration_ms, tokens, cost, error))
+    
+    report = []
+    for node, rows in per_node.items():
+        durations = [row[0] for row in rows]
+        report.append({
+            "node": node,
+            "calls": len(rows),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "tokens": sum(row[1] for row in rows),
+            "cost": sum(row[2] for row in rows),
+            "errors": sum(1 for row in rows if row[3])
+        })
+    return sorted(report, key=lambda item: -item["p95_ms"])
+
+def slowest_questions(limit: int = 10) -> list[dict]:
+    """Returns the questions with the highest total node time, with their token, cost and refinement totals."""
+    with connection_manager.get_connection() as conn:
+        cursor = conn.execute(
+            """
+            SELECT thread_id, question, SUM(duration_ms), SUM(input_tokens + output_tokens), SUM(cost),
+                   SUM(llm_calls), SUM(tool_calls), SUM(refinements)
+            FROM node_traces
+            GROUP BY thread_id, question
+            ORDER BY SUM(duration_ms) DESC
+            LIMIT ?
+            """,
+            (limit,)
+        )
+        keys = ("thread_id", "question", "total_ms", "tokens", "cost", "llm_calls", "tool_calls", "refinements")
+        return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-node latency, token and cost report from the node traces.")
+    parser.add_argument("--thread", help="Only report the nodes of this thread.")
+    parser.add_argument("--limit", type=int, default=10, help="Slowest questions shown.")
+    args = parser.parse_args()
+    
+    print(f"{'node':<18}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'tokens':>10}{'cost $':>10}{'errors':>8}")
+    for row in node_report(args.thread):
+        print(
+            f"{row['node']:<18}{row['calls']:>7}{row['p50_ms']:>10.0f}{row['p95_ms']:>10.0f}"
+            f"{row['tokens']:>10}{row['cost']:>10.4f}{row['errors']:>8}"
+        )
+    
+    print("\nSlowest questions:")
+    for row in slowest_questions(args.limit):
+        print(
+            f"{row['total_ms'] / 1000:>7.1f}s  {row['tokens']:>6} tokens  ${row['cost']:.4f}  "
+            f"{row['llm_calls']} LLM / {row['tool_calls']} tool calls, {row['refinements']} refinements  "
+            f"[{row['thread_id']}] {row['question'][:80]}"
+        )
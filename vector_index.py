@@ -0,0 +1,159 @@
+import logging
+import math
+import os
+import random
+import sqlite3
+from typing import Any
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Import from our local project files
+from config import ANN_INDEX_TYPE, ANN_NPROBE, ANN_EF_SEARCH, RETRIEVER_K, RETRIEVER_SCORE_THRESHOLD
+from rag_setup import STORE_BATCH_SIZE, iter_collection
+
+logger = logging.getLogger(__name__)
+
+ANN_INDEX_PATH = "ann_index"
+INDEX_FILE = os.path.join(ANN_INDEX_PATH, "index.faiss")
+DOCSTORE_FILE = os.path.join(ANN_INDEX_PATH, "docstore.sqlite")
+
+# HNSW graph degree
+HNSW_M = 32
+# IVF centroids are trained on a random sample of the store: at least this many vectors, and at
+# least TRAINING_POINTS_PER_LIST per inverted list (Faiss warns below 39)
+TRAINING_SAMPLE_SIZE = 50000
+TRAINING_POINTS_PER_LIST = 39
+
+def relevance_score(cosine: np.ndarray) -> np.ndarray:
+    """
+    Converts cosine similarities of unit vectors into the relevance score Chroma reports
+    (1 - squared L2 distance / sqrt(2)), so that the same threshold means the same on every backend.
+    """
+    return 1.0 - (2.0 - 2.0 * cosine) / math.sqrt(2)
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def iter_store_batches(collection):
+    """Yields the Chroma collection in batches of (embeddings, documents, metadatas)."""
+    for batch in iter_collection(collection, ["embeddings", "documents", "metadatas"]):
+        yield np.asarray(batch["embeddings"], dtype=np.float32), batch["documents"], batch["metadatas"]
+
+def ivf_list_count(count: int) -> int:
+    # The usual rule of thumb: about 4 * sqrt(N) inverted lists
+    return max(1, int(4 * math.sqrt(count)))
+
+def sample_store_vectors(collection, size: int, seed: int = 0) -> np.ndarray:
+    """Returns the embeddings of `size` rows drawn at random from the whole Chroma collection."""
+    ids = [doc_id for batch in iter_collection(collection, []) for doc_id in batch["ids"]]
+    sample = random.Random(seed).sample(ids, min(size, len(ids)))
+    vectors = [
+        np.asarray(collection.get(ids=sample[start:start + STORE_BATCH_SIZE], include=["embeddings"])["embeddings"], dtype=np.float32)
+        for start in range(0, len(sample), STORE_BATCH_SIZE)
+    ]
+    return np.concatenate(vectors)
+
+def create_index(index_type: str, dimension: int, count: int, training_size: int | None = None):
+    """
+    Creates an empty inner-product index of the given type, sized for `count` vectors.
+    IVF gets no more inverted lists than `training_size` training vectors can fill.
+    """
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "ivf":
+        trainable = (training_size if training_size is not None else count) // TRAINING_POINTS_PER_LIST
+        nlist = max(1, min(ivf_list_count(count), trainable))
+        return faiss.IndexIVFFlat(faiss.IndexFlatIP(dimension), dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown ANN index type '{index_type}', expected 'ivf' or 'hnsw'")
+
+def build_ann_index(collection, index_type: str = ANN_INDEX_TYPE):
+    """
+    Builds the ANN index and its docstore from the vectors already stored in Chroma, without re-embedding.
+    The docstore maps index positions to abstracts and stays on disk.
+    """
+    os.makedirs(ANN_INDEX_PATH, exist_ok=True)
+    count = collection.count()
+    
+    docstore = sqlite3.connect(DOCSTORE_FILE)
+    docstore.execute("DROP TABLE IF EXISTS documents")
+    docstore.execute("CREATE TABLE documents (position INTEGER PRIMARY KEY, title TEXT, content TEXT NOT NULL)")
+    
+    index = None
+    if index_type == "ivf" and count:
+        # Train the centroids on vectors drawn across the whole store, the insertion order
+        # of the corpus (e.g. by date or category) would bias a leading slice
+        sample_size = min(count, max(TRAINING_POINTS_PER_LIST * ivf_list_count(count), TRAINING_SAMPLE_SIZE))
+        training = normalize_rows(sample_store_vectors(collection, sample_size))
+        index = create_index(index_type, training.shape[1], count, len(training))
+        logger.info("Training %d IVF lists on %d sampled vectors", index.nlist, len(training))
+        index.train(training)
+
+    position = 0
+    for vectors, documents, metadatas in iter_store_batches(collection):
+        vectors = normalize_rows(vectors)
+        if index is None:
+            index = create_index(index_type, vectors.shape[1], count)
+        index.add(vectors)
+        docstore.executemany(
+            "INSERT INTO documents (position, title, content) VALUES (?, ?, ?)",
+            [(position + i, (meta or {}).get("title"), doc) for i, (doc, meta) in enumerate(zip(documents, metadatas))]
+        )
+        position += len(documents)
+        logger.info("Indexed %d/%d vectors", position, count)
+    
+    docstore.commit()
+    docstore.close()
+    faiss.write_index(index, INDEX_FILE)
+
+def load_ann_index():
+    """
+    Loads the ANN index from disk. IVF inverted lists are memory-mapped, so vectors are paged in
+    on demand instead of being read into memory; HNSW indexes are read into memory.
+    """
+    return faiss.read_index(INDEX_FILE, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+def set_search_params(index, nprobe: int = ANN_NPROBE, ef_search: int = ANN_EF_SEARCH):
+    """Applies the recall/latency knobs of the index type: nprobe for IVF, efSearch for HNSW."""
+    if hasattr(index, "nprobe"):
+        index.nprobe = nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+class FaissRetriever(BaseRetriever):
+    """Retriever over the FAISS ANN index, returning the top `k` abstracts with a relevance above the threshold."""
+
+    index: Any
+    embeddings: Any
+    k: int = RETRIEVER_K
+    score_threshold: float = RETRIEVER_SCORE_THRESHOLD
+    docstore_path: str = DOCSTORE_FILE
+
+    def search(self, query_vector: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the relevance scores and positions of the `k` nearest abstracts."""
+        scores, positions = self.index.search(normalize_rows(query_vector.reshape(1, -1)), k)
+        return relevance_score(scores[0]), positions[0]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        scores, positions = self.search(np.asarray(self.embeddings.embed_query(query)), self.k)
+        hits = [(int(pos), float(score)) for pos, score in zip(positions, scores) if pos >= 0 and score >= self.score_threshold]
+        if not hits:
+            return []
+        
+        with sqlite3.connect(self.docstore_path) as docstore:
+            placeholders = ",".join("?" * len(hits))
+            rows = docstore.execute(
+                f"SELECT position, title, content FROM documents WHERE position IN ({placeholders})",
+                [pos for pos, _ in hits]
+            ).fetchall()
+        by_position = {pos: (title, content) for pos, title, content in rows}
+        
+        return [
+            Document(page_content=by_position[pos][1], metadata={"title": by_position[pos][0], "score": score})
+            for pos, score in hits if pos in by_position
+        ]